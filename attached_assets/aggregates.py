@@ -0,0 +1,95 @@
+from pricing import from_cents, to_cents
+
+FIELDS = ('count', 'subtotal', 'discounts', 'total', 'advance_payment', 'balance_due')
+
+
+def receipt_amounts(receipt):
+    # The receipt's contribution to its day and month, in cents
+    subtotal = to_cents(receipt['subtotal'])
+    total = to_cents(receipt['total'])
+    return (1, subtotal, subtotal - total, total,
+            to_cents(receipt.get('advance_payment', 0)), to_cents(receipt['balance_due']))
+
+
+class SalesAggregates:
+    # Per-day and per-month sums of FIELDS, kept in integer cents and
+    # updated by the difference each receipt change makes, so reading a
+    # day's or a month's figures never touches the history.
+    def __init__(self):
+        self.days = {}
+        self.months = {}
+
+    @classmethod
+    def build(cls, receipts):
+        aggregates = cls()
+        for receipt in receipts:
+            aggregates._apply(receipt, 1)
+        return aggregates
+
+    @classmethod
+    def rebuild(cls, data_manager):
+        return cls.build(data_manager.iter_receipts())
+
+    def _apply(self, receipt, sign):
+        amounts = receipt_amounts(receipt)
+        day = receipt['date'][:10]
+        for buckets, key in ((self.days, day), (self.months, day[:7])):
+            sums = buckets.setdefault(key, [0] * len(FIELDS))
+            for i, amount in enumerate(amounts):
+                sums[i] += sign * amount
+            if not sums[0]:
+                del buckets[key]
+
+    def receipt_saved(self, receipt):
+        self._apply(receipt, 1)
+
+    def receipt_updated(self, old_receipt, receipt):
+        self._apply(old_receipt, -1)
+        self._apply(receipt, 1)
+
+    def receipt_deleted(self, old_receipt):
+        self._apply(old_receipt, -1)
+
+    def _totals(self, sums):
+        sums = sums or [0] * len(FIELDS)
+        totals = {field: from_cents(amount) for field, amount in zip(FIELDS, sums)}
+        totals['count'] = sums[0]
+        return totals
+
+    def day(self, day):
+        # Figures for a YYYY-MM-DD day
+        return self._totals(self.days.get(day))
+
+    def month(self, month):
+        # Figures for a YYYY-MM month
+        return self._totals(self.months.get(month))
+
+    def between(self, since, until):
+        # Figures for the YYYY-MM-DD days in [since, until], summed from the
+        # day buckets
+        sums = [0] * len(FIELDS)
+        for day, day_sums in self.days.items():
+            if since <= day <= until:
+                for i, amount in enumerate(day_sums):
+                    sums[i] += amount
+        return self._totals(sums)
+
+    def to_dict(self):
+        return {'days': self.days, 'months': self.months}
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregates = cls()
+        aggregates.days = data['days']
+        aggregates.months = data['months']
+        return aggregates
+
+    def differences(self, other):
+        # Keys whose sums disagree between two aggregates, as
+        # (key, these sums, other sums); used to verify against a rebuild
+        found = []
+        for mine, theirs in ((self.days, other.days), (self.months, other.months)):
+            for key in sorted(mine.keys() | theirs.keys()):
+                if mine.get(key) != theirs.get(key):
+                    found.append((key, mine.get(key), theirs.get(key)))
+        return found
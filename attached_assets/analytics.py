@@ -0,0 +1,95 @@
+import numpy as np
+
+PERIODS = {'day': 'datetime64[D]', 'month': 'datetime64[M]'}
+
+
+def _cents(amounts):
+    # Stored amounts are already rounded to the cent, so rounding the scaled
+    # floats recovers the exact integer cents
+    return np.rint(np.array(amounts, dtype=np.float64) * 100).astype(np.int64)
+
+
+class SalesData:
+    # Receipt history as columns. One row per receipt (date, amounts in
+    # cents) and one row per item (owning receipt row, product code,
+    # quantity, line total in cents); product names are dictionary encoded
+    # into self.products so grouping is integer work.
+    def __init__(self, receipts):
+        dates, subtotals, totals, balances = [], [], [], []
+        item_rows, item_codes, quantities, line_totals = [], [], [], []
+        codes = {}
+        for row, receipt in enumerate(receipts):
+            dates.append(receipt['date'])
+            subtotals.append(receipt['subtotal'])
+            totals.append(receipt['total'])
+            balances.append(receipt['balance_due'])
+            for item in receipt['items']:
+                item_rows.append(row)
+                item_codes.append(codes.setdefault(item['product'], len(codes)))
+                quantities.append(item['quantity'])
+                line_totals.append(item['total'])
+        self.dates = np.array(dates, dtype='datetime64[s]')
+        self.totals = _cents(totals)
+        self.balances = _cents(balances)
+        self.discounts = _cents(subtotals) - self.totals
+        self.item_rows = np.array(item_rows, dtype=np.int64)
+        self.item_codes = np.array(item_codes, dtype=np.int64)
+        self.quantities = np.array(quantities, dtype=np.int64)
+        self.line_totals = _cents(line_totals)
+        self.products = list(codes)
+
+    @classmethod
+    def load(cls, data_manager, since=None, until=None):
+        # since/until are inclusive YYYY-MM-DD bounds
+        return cls(data_manager.get_receipts_between(since, until))
+
+    def __len__(self):
+        return len(self.dates)
+
+    def _mask(self, since=None, until=None):
+        mask = np.ones(len(self.dates), dtype=bool)
+        if since:
+            mask &= self.dates >= np.datetime64(since, 's')
+        if until:
+            mask &= self.dates < np.datetime64(until, 'D') + np.timedelta64(1, 'D')
+        return mask
+
+    def summary(self, since=None, until=None):
+        mask = self._mask(since, until)
+        return {
+            'receipts': int(mask.sum()),
+            'revenue': int(self.totals[mask].sum()) / 100,
+            'outstanding': int(np.maximum(self.balances[mask], 0).sum()) / 100,
+            'discounts': int(self.discounts[mask].sum()) / 100,
+        }
+
+    def by_period(self, period='day', since=None, until=None):
+        # Per day or month, oldest first: receipts, revenue, outstanding
+        # balance and discounts given
+        mask = self._mask(since, until)
+        keys = self.dates[mask].astype(PERIODS[period])
+        periods, groups = np.unique(keys, return_inverse=True)
+        count = len(periods)
+        counts = np.bincount(groups, minlength=count)
+        revenue = np.bincount(groups, weights=self.totals[mask], minlength=count)
+        outstanding = np.bincount(groups, weights=np.maximum(self.balances[mask], 0), minlength=count)
+        discounts = np.bincount(groups, weights=self.discounts[mask], minlength=count)
+        return [
+            {'period': str(periods[i]), 'receipts': int(counts[i]), 'revenue': float(revenue[i]) / 100,
+             'outstanding': float(outstanding[i]) / 100, 'discounts': float(discounts[i]) / 100}
+            for i in range(count)
+        ]
+
+    def top_products(self, by='revenue', limit=10, since=None, until=None):
+        # Best sellers by 'revenue' or 'quantity'
+        selected = self._mask(since, until)[self.item_rows]
+        codes = self.item_codes[selected]
+        size = len(self.products)
+        quantity = np.bincount(codes, weights=self.quantities[selected], minlength=size)
+        revenue = np.bincount(codes, weights=self.line_totals[selected], minlength=size)
+        ranking = quantity if by == 'quantity' else revenue
+        order = np.argsort(-ranking, kind='stable')[:limit]
+        return [
+            {'product': self.products[code], 'quantity': int(quantity[code]), 'revenue': float(revenue[code]) / 100}
+            for code in order if quantity[code]
+        ]
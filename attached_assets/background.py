@@ -0,0 +1,55 @@
+import queue
+import threading
+
+from instrumentation import span
+
+
+class TaskQueue:
+    # Runs jobs one at a time on a worker thread, in submission order, so
+    # slow disk and PDF work never blocks the Tk mainloop. Finished jobs are
+    # handed back through poll(), which the UI calls from after() so that
+    # callbacks run on the Tk thread.
+    def __init__(self):
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, callback=None):
+        with self._lock:
+            self._pending += 1
+        self._jobs.put((func, args, callback))
+
+    def pending(self):
+        # Jobs submitted whose callback has not run yet
+        with self._lock:
+            return self._pending
+
+    def _run(self):
+        while True:
+            func, args, callback = self._jobs.get()
+            try:
+                with span(f"tasks.{func.__name__}"):
+                    result, error = func(*args), None
+            except Exception as e:
+                result, error = None, e
+            self._results.put((callback, result, error))
+            self._jobs.task_done()
+
+    def poll(self):
+        while True:
+            try:
+                callback, result, error = self._results.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._pending -= 1
+            if callback:
+                callback(result, error)
+
+    def join(self):
+        # Block until every submitted job has finished (used on shutdown)
+        self._jobs.join()
+        self.poll()
@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import sys
+
+from benchmarks.suite import CASES, compare, parse_size, run
+from storage import STORAGE_BACKENDS
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Run from attached_assets/:
+#   python -m benchmarks --sizes 1k 10k --out results.json
+#   python -m benchmarks --sizes 1k 10k --save-baseline
+# Timings are machine specific, so compare against a baseline recorded on
+# the same machine.
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Lens Optic performance benchmarks")
+    parser.add_argument("--sizes", nargs="+", default=["1k", "10k"], help="receipt counts, e.g. 1k 10k 100k 1m")
+    parser.add_argument("--backend", choices=STORAGE_BACKENDS, default="journal")
+    parser.add_argument("--format", default="json", help="data file format (see serializers.FORMATS)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the best is kept")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--data-root", help="where generated datasets are kept (default: a temp dir)")
+    parser.add_argument("--out", default="benchmark_results.json", help="results file")
+    parser.add_argument("--baseline", default=BASELINE, help="results file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="ratio change reported as slower/faster")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 if any case got slower")
+    args = parser.parse_args(argv)
+
+    document = run([parse_size(size) for size in args.sizes], args.backend, args.format, args.seed,
+                   args.repeat, args.cases, args.data_root, progress=lambda text: print(text, file=sys.stderr))
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        document['baseline'] = {'path': args.baseline, 'created': baseline['meta']['created']}
+        document['comparison'] = [
+            {'size': size, 'case': case, 'baseline': base, 'current': current, 'ratio': ratio, 'verdict': verdict}
+            for size, case, base, current, ratio, verdict in compare(document, baseline, args.threshold)
+        ]
+    with open(args.out, 'w') as f:
+        json.dump(document, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(document, f, indent=2)
+
+    print(f"{'Size':<6}  {'Case':<15}  {'Seconds':>10}  {'Ops/s':>12}  {'Baseline':>10}  {'Ratio':>6}")
+    verdicts = {(row['size'], row['case']): row for row in document.get('comparison', ())}
+    for size, cases in document['results'].items():
+        for case, result in cases.items():
+            if 'skipped' in result:
+                print(f"{size:<6}  {case:<15}  skipped: {result['skipped']}")
+                continue
+            line = f"{size:<6}  {case:<15}  {result['seconds']:>10.4f}  {result['rate']:>12.1f}"
+            row = verdicts.get((size, case))
+            if row:
+                line += f"  {row['baseline']:>10.4f}  {row['ratio']:>6.2f}  {row['verdict']}"
+            print(line)
+    print(f"Results written to {args.out}" + (f" and {args.baseline}" if args.save_baseline else ""))
+    if args.fail_on_regression and any(row['verdict'] == 'slower' for row in document.get('comparison', ())):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
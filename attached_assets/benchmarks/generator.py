@@ -0,0 +1,141 @@
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+from pricing import from_cents, price_receipt
+from serializers import dumps
+from storage import load_config, save_config
+
+FIRST_NAMES = (
+    'Karim', 'Rachid', 'Fatima', 'Khadija', 'Youssef', 'Amina', 'Mohamed', 'Salma', 'Omar', 'Nadia',
+    'Hicham', 'Laila', 'Said', 'Zineb', 'Mehdi', 'Imane', 'Hassan', 'Sara', 'Anas', 'Meryem',
+    'Émile', 'Chloé', 'Noël', 'Inès',
+)
+LAST_NAMES = (
+    'El Amrani', 'Berrada', 'Bennani', 'Alaoui', 'Tazi', 'El Idrissi', 'Chraibi', 'Fassi', 'Benjelloun',
+    'Ouazzani', 'Lahlou', 'Sqalli', 'Kettani', 'Zniber', 'Benkirane', 'Naciri', 'Dupont', 'Lefèvre',
+)
+LENS_KINDS = ('Verre unifocal', 'Verre progressif', 'Verre bifocal', 'Verre photochromique', 'Lentille')
+LENS_OPTIONS = ('1.5', '1.6', '1.67', 'AR', 'anti-lumière bleue', 'aminci', 'teinté')
+FRAME_BRANDS = ('Ray-Ban', 'Oakley', 'Vogue', 'Persol', 'Silhouette', 'Carrera', 'Guess', 'Police')
+SERVICES = ('Examen de vue', 'Ajustement monture', 'Étui', 'Cordon', 'Spray nettoyant', 'Microfibre')
+
+
+def generate_products(rng, count=300):
+    # Lenses, frames and services with shop-like names and prices
+    products = []
+    names = set()
+    while len(products) < count:
+        kind = rng.random()
+        if kind < 0.5:
+            name = f"{rng.choice(LENS_KINDS)} {rng.choice(LENS_OPTIONS)} {rng.choice(LENS_OPTIONS)}"
+            price = rng.randrange(150, 2500) * 1.0
+        elif kind < 0.9:
+            name = f"Monture {rng.choice(FRAME_BRANDS)} {rng.randrange(1000, 9999)}"
+            price = rng.randrange(300, 4000) - 0.01
+        else:
+            name = rng.choice(SERVICES)
+            price = rng.randrange(20, 300) * 1.0
+        if name in names:
+            name = f"{name} #{len(products)}"
+        names.add(name)
+        products.append({'name': name, 'price': price})
+    return products
+
+
+def _eye(rng):
+    # Sphere and cylinder in quarter dioptres, stored as typed in the form
+    if rng.random() < 0.1:
+        return {'sph': '', 'cyl': '', 'axe': ''}
+    cyl = rng.choice(('', '', '-0.25', '-0.50', '-0.75', '-1.00', '-1.50', '-2.00'))
+    return {
+        'sph': f"{rng.randrange(-32, 17) * 0.25:+.2f}",
+        'cyl': cyl,
+        'axe': str(rng.randrange(0, 181, 5)) if cyl else '',
+    }
+
+
+def generate_receipts(rng, count, products, start=datetime(2020, 1, 1), clients=None):
+    # Receipts in date order, one every 20 minutes or so, from a client
+    # pool in which regulars come back; amounts come from price_receipt
+    clients = clients or max(count // 4, 1)
+    pool = []
+    for i in range(clients):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        phone = f"06{rng.randrange(10 ** 8):08d}" if rng.random() < 0.85 else ''
+        pool.append((name, phone))
+    date = start
+    for receipt_id in range(1, count + 1):
+        date += timedelta(seconds=rng.randrange(60, 2160))
+        if rng.random() < 0.3:
+            # Regulars: a few clients account for many of the visits
+            name, phone = pool[min(int(rng.paretovariate(1.2)) - 1, clients - 1)]
+        else:
+            name, phone = pool[rng.randrange(clients)]
+        items = []
+        for product in rng.sample(products, rng.choice((1, 1, 2, 2, 2, 3, 4))):
+            items.append({'product': product['name'], 'quantity': rng.choice((1, 1, 1, 2)),
+                          'price': product['price'], 'total': 0.0})
+        receipt = {
+            'id': receipt_id,
+            'date': date.strftime("%Y-%m-%d %H:%M:%S"),
+            'client_name': name,
+            'client_phone': phone,
+            'right_eye': _eye(rng),
+            'left_eye': _eye(rng),
+            'items': items,
+            'discount': rng.choice((0, 0, 0, 5, 10, 15)),
+            'numerical_discount': rng.choice((0, 0, 0, 0, 50)),
+            'advance_payment': 0,
+        }
+        price_receipt(receipt)
+        # Most clients pay part up front, some settle later
+        receipt['advance_payment'] = from_cents(int(receipt['total'] * 100 * rng.choice((1, 1, 0.5, 0.3, 0))))
+        if receipt['advance_payment'] < receipt['total'] and rng.random() < 0.3:
+            paid = date + timedelta(days=rng.randrange(1, 30))
+            receipt['payments'] = [{'date': paid.strftime("%Y-%m-%d %H:%M:%S"),
+                                    'amount': from_cents(int((receipt['total'] - receipt['advance_payment']) * 50))}]
+        price_receipt(receipt)
+        yield receipt
+
+
+def write_dataset(data_dir, count, seed=0, backend='journal', file_format='json'):
+    # A data directory with `count` receipts for the given backend. The
+    # history is written as a legacy receipts.json, which every backend
+    # migrates from on first open (SQLite through its migration), so the
+    # data is identical whatever the backend. Returns the dataset metadata.
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    products = generate_products(rng)
+    receipts = generate_receipts(rng, count, products)
+    with open(os.path.join(data_dir, "products.json"), 'wb') as f:
+        f.write(dumps(products, file_format))
+    with open(os.path.join(data_dir, "receipts.json"), 'wb') as f:
+        if file_format == 'json':
+            # Streamed, so a large history is never held twice
+            f.write(b'[')
+            for i, receipt in enumerate(receipts):
+                f.write(b',' + dumps(receipt) if i else dumps(receipt))
+            f.write(b']')
+        else:
+            f.write(dumps(list(receipts), file_format))
+    config = load_config(data_dir, environ=False)
+    config['storage'] = 'journal' if backend == 'sqlite' else backend
+    config['format'] = file_format
+    save_config(data_dir, config)
+    if backend == 'sqlite':
+        from sqlite_storage import migrate_json_to_sqlite
+        migrate_json_to_sqlite(data_dir)
+    meta = {'count': count, 'seed': seed, 'backend': backend, 'format': file_format}
+    with open(os.path.join(data_dir, "dataset.json"), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def dataset_meta(data_dir):
+    path = os.path.join(data_dir, "dataset.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
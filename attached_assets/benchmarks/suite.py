@@ -0,0 +1,248 @@
+import copy
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.generator import dataset_meta, generate_receipts, write_dataset
+from data_manager import DataManager
+from pricing import ReceiptPricing, format_money
+
+CASES = ('open', 'load_all', 'history_list', 'save', 'update', 'delete', 'product_lookup', 'totals', 'pdf')
+PAGE_SIZE = 100
+
+
+def parse_size(text):
+    # 1k, 10k, 100k, 1m or a plain number
+    text = text.lower()
+    for suffix, factor in (('k', 1000), ('m', 1000000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+
+def size_label(count):
+    if count >= 1000000 and count % 1000000 == 0:
+        return f"{count // 1000000}m"
+    if count >= 1000 and count % 1000 == 0:
+        return f"{count // 1000}k"
+    return str(count)
+
+
+def _result(seconds, ops):
+    return {'seconds': seconds, 'ops': ops, 'rate': ops / seconds if seconds else 0.0}
+
+
+def _best(func, repeat):
+    # Best of `repeat` runs of func(), which returns its operation count
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        ops = func()
+        seconds = time.perf_counter() - started
+        if best is None or seconds < best['seconds']:
+            best = _result(seconds, ops)
+    return best
+
+
+def prepare(data_root, count, seed, backend, file_format):
+    # A pristine dataset is generated once per (backend, format, size,
+    # seed) and opened once so migrations and derived indexes are done;
+    # each run works on a fresh copy of it
+    key = f"{backend}-{file_format}-{size_label(count)}-{seed}"
+    pristine = os.path.join(data_root, key)
+    expected = {'count': count, 'seed': seed, 'backend': backend, 'format': file_format}
+    if dataset_meta(pristine) != expected:
+        shutil.rmtree(pristine, ignore_errors=True)
+        write_dataset(pristine, count, seed, backend, file_format)
+        dm = DataManager(pristine)
+        dm.count_receipts()
+        dm.get_day_totals(datetime.now().strftime("%Y-%m-%d"))
+        dm.flush()
+    work = pristine + "-run"
+    shutil.rmtree(work, ignore_errors=True)
+    shutil.copytree(pristine, work)
+    return work
+
+
+def bench_open(data_dir, repeat):
+    # What starting the app costs: the stores, the first history page and
+    # the home screen figures from the derived indexes
+    def run():
+        dm = DataManager(data_dir)
+        dm.count_receipts()
+        dm.get_header_page(0, PAGE_SIZE * 2)
+        dm.get_day_totals(datetime.now().strftime("%Y-%m-%d"))
+        return 1
+    return _best(run, repeat)
+
+
+def bench_load_all(data_dir, repeat):
+    def run():
+        return len(DataManager(data_dir).get_receipts())
+    return _best(run, repeat)
+
+
+def bench_history_list(dm, repeat):
+    # ReceiptHistory's first window and a scroll through ten pages spread
+    # over the history, rows formatted the way the grid shows them
+    total = dm.count_receipts()
+    starts = [0] + [total * i // 10 for i in range(1, 10)]
+
+    def run():
+        rows = []
+        for start in starts:
+            for header in dm.get_header_page(start, PAGE_SIZE * 2):
+                rows.append((header['date'], header['client_name'], format_money(header['total']),
+                             f"-{header['discount']}%/-${header.get('numerical_discount', 0):.2f}"))
+        return len(rows)
+    return _best(run, repeat)
+
+
+def bench_mutations(dm, count, seed, repeat):
+    # Save, update and delete `count` new receipts through the DataManager,
+    # derived index upkeep included; the history is back to its original
+    # contents after each round
+    results = {}
+    products = dm.get_products()
+    new = list(generate_receipts(random.Random(seed + 1), count, products, start=datetime.now()))
+    for _ in range(repeat):
+        receipts = [copy.deepcopy(receipt) for receipt in new]
+        timings = {}
+        started = time.perf_counter()
+        for receipt in receipts:
+            receipt.pop('id', None)
+            dm.save_receipt(receipt)
+        timings['save'] = time.perf_counter() - started
+        started = time.perf_counter()
+        for receipt in receipts:
+            receipt['client_name'] += " B"
+            dm.update_receipt(receipt['id'], receipt)
+        timings['update'] = time.perf_counter() - started
+        started = time.perf_counter()
+        for receipt in receipts:
+            dm.delete_receipt(receipt['id'])
+        timings['delete'] = time.perf_counter() - started
+        for case, seconds in timings.items():
+            if case not in results or seconds < results[case]['seconds']:
+                results[case] = _result(seconds, count)
+    dm.flush()
+    return results
+
+
+def bench_product_lookup(dm, repeat):
+    # Exact lookups of every product and combobox suggestions for the
+    # first two and four letters of each name
+    catalog = dm.get_catalog()
+    names = [product['name'] for product in catalog.products]
+    prefixes = [name[:n] for name in names for n in (2, 4)]
+
+    def run():
+        for name in names:
+            catalog.get(name)
+        for prefix in prefixes:
+            catalog.suggest(prefix)
+        return len(names) + len(prefixes)
+    return _best(run, repeat)
+
+
+def bench_totals(dm, repeat):
+    receipts = dm.get_receipt_page(0, 1000)
+
+    def run():
+        for receipt in receipts:
+            ReceiptPricing.from_receipt(receipt).summary()
+        return len(receipts)
+    return _best(run, repeat)
+
+
+def bench_pdf(dm, count, repeat):
+    try:
+        import reportlab
+    except ImportError:
+        return {'skipped': "ReportLab is not installed"}
+    from pdf_export import generate_pdf_from_receipt
+
+    receipts = dm.get_receipt_page(0, count)
+    out_dir = tempfile.mkdtemp(prefix="optical-bench-pdf-")
+    try:
+        def run():
+            for receipt in receipts:
+                generate_pdf_from_receipt(receipt, os.path.join(out_dir, f"{receipt['id']}.pdf"))
+            return len(receipts)
+        return _best(run, repeat)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+def run_size(data_dir, count, seed, repeat=3, cases=CASES, mutations=50, pdfs=20):
+    results = {}
+    if 'open' in cases:
+        results['open'] = bench_open(data_dir, repeat)
+    if 'load_all' in cases:
+        results['load_all'] = bench_load_all(data_dir, repeat)
+    dm = DataManager(data_dir)
+    if 'history_list' in cases:
+        results['history_list'] = bench_history_list(dm, repeat)
+    if {'save', 'update', 'delete'} & set(cases):
+        for case, result in bench_mutations(dm, mutations, seed, repeat).items():
+            if case in cases:
+                results[case] = result
+    if 'product_lookup' in cases:
+        results['product_lookup'] = bench_product_lookup(dm, repeat)
+    if 'totals' in cases:
+        results['totals'] = bench_totals(dm, repeat)
+    if 'pdf' in cases:
+        results['pdf'] = bench_pdf(dm, pdfs, repeat)
+    return results
+
+
+def run(sizes, backend='journal', file_format='json', seed=0, repeat=3, cases=CASES,
+        data_root=None, progress=None):
+    # Runs every case at every size and returns the results document that
+    # gets written to the results file and compared against the baseline
+    data_root = data_root or os.path.join(tempfile.gettempdir(), "optical-bench")
+    document = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'backend': backend,
+            'format': file_format,
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': {},
+    }
+    for count in sizes:
+        if progress:
+            progress(f"{size_label(count)}: preparing dataset")
+        data_dir = prepare(data_root, count, seed, backend, file_format)
+        if progress:
+            progress(f"{size_label(count)}: running")
+        document['results'][size_label(count)] = run_size(data_dir, count, seed, repeat, cases)
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return document
+
+
+def compare(document, baseline, threshold=0.2):
+    # (size, case, baseline seconds, current seconds, ratio, verdict) for
+    # every case timed in both; slower or faster only past the threshold
+    rows = []
+    for size, cases in document['results'].items():
+        for case, result in cases.items():
+            base = baseline.get('results', {}).get(size, {}).get(case)
+            if not base or 'seconds' not in base or 'seconds' not in result:
+                continue
+            ratio = result['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+            verdict = ''
+            if ratio > 1 + threshold:
+                verdict = 'slower'
+            elif ratio < 1 / (1 + threshold):
+                verdict = 'faster'
+            rows.append((size, case, base['seconds'], result['seconds'], ratio, verdict))
+    return rows
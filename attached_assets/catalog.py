@@ -0,0 +1,108 @@
+import bisect
+
+from search_index import normalize_name
+
+
+class ProductCatalog:
+    # Products in display order, with a name -> product hash index for
+    # exact lookups and a sorted list of (term, name) pairs for type-ahead.
+    # Every word of a name starts a term, so "vari" finds "Essilor Varilux".
+    def __init__(self, products=()):
+        self.products = []
+        self.by_name = {}
+        self.keys = []
+        for product in products:
+            if product['name'] not in self.by_name:
+                self.by_name[product['name']] = product
+                self.keys.extend(self._keys(product['name']))
+            self.products.append(product)
+        self.keys.sort()
+        self._positions = None
+
+    def __len__(self):
+        return len(self.products)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def _keys(self, name):
+        words = normalize_name(name).split()
+        return {(' '.join(words[i:]), name) for i in range(len(words))}
+
+    def _index(self, product):
+        self.by_name[product['name']] = product
+        for key in self._keys(product['name']):
+            bisect.insort(self.keys, key)
+
+    def _unindex(self, name):
+        del self.by_name[name]
+        for key in self._keys(name):
+            position = bisect.bisect_left(self.keys, key)
+            if position < len(self.keys) and self.keys[position] == key:
+                del self.keys[position]
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    def position(self, name):
+        # Index of the product in display order; rebuilt lazily after a
+        # removal or reorder shifted the positions
+        if self._positions is None:
+            self._positions = {}
+            for i, product in enumerate(self.products):
+                self._positions.setdefault(product['name'], i)
+        return self._positions[name]
+
+    def suggest(self, text, limit=50):
+        # Up to `limit` product names with a word starting with `text`,
+        # in catalog order when nothing has been typed yet
+        prefix = normalize_name(text)
+        if not prefix:
+            return [product['name'] for product in self.products[:limit]]
+        names = []
+        seen = set()
+        position = bisect.bisect_left(self.keys, (prefix,))
+        while position < len(self.keys) and len(names) < limit:
+            term, name = self.keys[position]
+            if not term.startswith(prefix):
+                break
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+            position += 1
+        return names
+
+    def add(self, product):
+        if product['name'] in self.by_name:
+            raise ValueError(f"Product {product['name']!r} already exists")
+        self._index(product)
+        if self._positions is not None:
+            self._positions[product['name']] = len(self.products)
+        self.products.append(product)
+
+    def replace(self, name, product):
+        if product['name'] != name and product['name'] in self.by_name:
+            raise ValueError(f"Product {product['name']!r} already exists")
+        index = self.position(name)
+        self._unindex(name)
+        self._index(product)
+        del self._positions[name]
+        self._positions[product['name']] = index
+        self.products[index] = product
+
+    def remove(self, name):
+        index = self.position(name)
+        self._unindex(name)
+        del self.products[index]
+        self._positions = None
+        # Older catalogs may repeat a name; the next one takes over the index
+        duplicate = next((p for p in self.products if p['name'] == name), None)
+        if duplicate is not None:
+            self._index(duplicate)
+        return index
+
+    def swap(self, i, j):
+        self.products[i], self.products[j] = self.products[j], self.products[i]
+        if self._positions is not None:
+            self._positions[self.products[i]['name']] = i
+            self._positions[self.products[j]['name']] = j
@@ -0,0 +1,273 @@
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import itertools
+import json
+import sys
+from datetime import datetime
+
+import instrumentation
+from data_manager import get_data_manager
+from serializers import FORMATS
+
+# Keep this module's imports to the headless core: no tkinter, customtkinter
+# or ReportLab, so cron jobs and scripts start in milliseconds.
+_IMPORTED = time.perf_counter()
+
+
+def cmd_list(dm, args):
+    if args.client:
+        headers = dm.search_receipts(args.client, limit=args.limit)
+    else:
+        headers = itertools.islice(dm.iter_receipt_headers(), args.limit)
+    for header in headers:
+        print(f"{header['id']:>6}  {header['date']}  {header['client_name']:<25.25}  "
+              f"{header['total']:>10.2f}  {header['balance_due']:>10.2f}")
+
+
+def cmd_export_pdf(dm, args):
+    from pdf_export import export_receipts
+
+    if args.ids:
+        receipts = [dm.get_receipt(receipt_id) for receipt_id in args.ids]
+    else:
+        receipts = dm.get_receipts_between(args.since, args.until)
+
+    def progress(done, total, rate):
+        print(f"\r{done}/{total} receipts ({rate:.1f}/s)", end="", file=sys.stderr)
+
+    cache = None if args.no_cache else dm.pdf_cache
+    result = export_receipts(receipts, args.out_dir, workers=args.workers, progress=progress, cache=cache)
+    print(file=sys.stderr)
+    print(f"Exported {result['count']} receipts to {args.out_dir} in {result['seconds']:.2f}s "
+          f"({result['rate']:.1f} receipts/s, {result['cached']} from the cache)")
+
+
+def cmd_pdf_cache(dm, args):
+    if args.action == "clear":
+        dm.pdf_cache.clear()
+    stats = dm.pdf_cache.stats()
+    print(f"{stats['entries']} PDFs, {stats['bytes'] / 2 ** 20:.1f} MiB of {dm.pdf_cache.max_bytes / 2 ** 20:.0f} MiB"
+          + (f", oldest used {stats['oldest']}" if stats['oldest'] else ""))
+
+
+def cmd_statement(dm, args):
+    from ledger import client_key
+    from pdf_export import generate_statement
+
+    key = client_key({'client_phone': args.phone or '', 'client_name': args.name or ''})
+    try:
+        client = dm.get_client(key)
+    except KeyError:
+        sys.exit(f"No receipts for client {args.phone or args.name}")
+    count = generate_statement(client, dm.iter_client_receipts(key), args.out)
+    print(f"Statement for {client['name']} ({count} receipts) written to {args.out}")
+
+
+def cmd_z_report(dm, args):
+    from pdf_export import generate_z_report
+
+    day = args.day or datetime.now().strftime("%Y-%m-%d")
+    totals = generate_z_report(day, dm.get_receipts_between(day, day), args.out)
+    print(f"Z-report for {day} ({totals['count']} receipts) written to {args.out}")
+
+
+def cmd_import(dm, args):
+    with open(args.path, 'r') as f:
+        if args.path.endswith('.jsonl'):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = json.load(f)
+    if args.products:
+        # Merge by name: known products get the new price, others are appended
+        products = dm.get_products()
+        positions = {p['name']: i for i, p in enumerate(products)}
+        for product in records:
+            if product['name'] in positions:
+                products[positions[product['name']]] = product
+            else:
+                positions[product['name']] = len(products)
+                products.append(product)
+        dm.save_product(products)
+        print(f"Imported {len(records)} products")
+    else:
+        for receipt in records:
+            receipt.pop('id', None)
+            dm.save_receipt(receipt)
+        print(f"Imported {len(records)} receipts")
+
+
+def cmd_stats(dm, args):
+    count = 0
+    revenue = 0.0
+    outstanding = 0.0
+    first = last = None
+    for header in dm.iter_receipt_headers():
+        count += 1
+        revenue += header['total']
+        outstanding += max(header['balance_due'], 0)
+        last = last or header['date']
+        first = header['date']
+    print(f"Storage:      {dm.config['storage']}")
+    print(f"Products:     {len(dm.get_products())}")
+    print(f"Receipts:     {count}")
+    if count:
+        print(f"Date range:   {first} .. {last}")
+    print(f"Revenue:      {revenue:.2f}")
+    print(f"Outstanding:  {outstanding:.2f}")
+
+
+def cmd_report(dm, args):
+    try:
+        from analytics import SalesData
+    except ImportError:
+        sys.exit("The report needs NumPy: pip install numpy")
+
+    loaded = time.perf_counter()
+    sales = SalesData.load(dm, args.since, args.until)
+    aggregated = time.perf_counter()
+    rows = sales.by_period(args.period)
+    summary = sales.summary()
+    top = sales.top_products(args.top_by, args.top)
+    done = time.perf_counter()
+
+    print(f"{args.period.capitalize():<10}  {'Receipts':>8}  {'Revenue':>12}  {'Outstanding':>12}  {'Discounts':>10}")
+    for row in rows:
+        print(f"{row['period']:<10}  {row['receipts']:>8}  {row['revenue']:>12.2f}  "
+              f"{row['outstanding']:>12.2f}  {row['discounts']:>10.2f}")
+    print(f"{'Total':<10}  {summary['receipts']:>8}  {summary['revenue']:>12.2f}  "
+          f"{summary['outstanding']:>12.2f}  {summary['discounts']:>10.2f}")
+    if top:
+        print()
+        print(f"Top products by {args.top_by}:")
+        for row in top:
+            print(f"  {row['product']:<30.30}  {row['quantity']:>6}  {row['revenue']:>12.2f}")
+    if args.timing:
+        print(f"load {(aggregated - loaded) * 1000:.1f} ms, "
+              f"aggregate {(done - aggregated) * 1000:.1f} ms", file=sys.stderr)
+
+
+def cmd_aggregates(dm, args):
+    from aggregates import SalesAggregates
+
+    if args.action == "rebuild":
+        aggregates = dm.rebuild_derived('sales_aggregates')
+        print(f"Rebuilt totals for {len(aggregates.days)} days and {len(aggregates.months)} months")
+        return
+    differences = dm.derived_index('sales_aggregates').differences(SalesAggregates.rebuild(dm))
+    for key, stored, expected in differences:
+        print(f"{key}: stored {stored}, expected {expected}")
+    if differences:
+        dm.flush()
+        sys.exit(f"{len(differences)} aggregate(s) out of date; run 'aggregates rebuild'")
+    print("Aggregates match the receipt history")
+
+
+def cmd_formats(dm, args):
+    from serializers import SAMPLE, available_formats, benchmark, check_round_trip
+
+    names = available_formats()
+    products = dm.get_products()
+    receipts = dm.get_receipts()
+    print(f"In use: {dm.config['format']}")
+    print(f"{'Format':<10}  {'Round trip':<10}  {'Bytes':>12}  {'Write ms':>9}  {'Parse ms':>9}")
+    for result in benchmark(receipts, names, repeat=args.repeat):
+        name = result['format']
+        ok = all(check_round_trip(obj, name) for obj in (SAMPLE, products, receipts))
+        print(f"{name:<10}  {'ok' if ok else 'FAILED':<10}  {result['bytes']:>12}  "
+              f"{result['write'] * 1000:>9.1f}  {result['parse'] * 1000:>9.1f}")
+    print(f"({len(receipts)} receipts)")
+
+
+def cmd_convert(dm, args):
+    if args.format == dm.config['format']:
+        print(f"Data is already stored as {args.format}")
+        return
+    try:
+        dm.convert_format(args.format)
+    except ValueError as e:
+        sys.exit(f"Conversion failed, data left as {dm.config['format']}: {e}")
+    print(f"Data converted to {args.format}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lens Optic command line tools")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--timing", action="store_true", help="print startup and run time to stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="list receipts, newest first")
+    list_parser.add_argument("--limit", type=int, default=20)
+    list_parser.add_argument("--client", help="search client names and phones")
+    list_parser.set_defaults(func=cmd_list)
+
+    export_parser = commands.add_parser("export-pdf", help="render receipts to PDF files")
+    export_parser.add_argument("out_dir")
+    export_parser.add_argument("--ids", type=int, nargs="*", help="receipt ids (default: all)")
+    export_parser.add_argument("--since", help="only receipts dated on or after YYYY-MM-DD")
+    export_parser.add_argument("--until", help="only receipts dated on or before YYYY-MM-DD")
+    export_parser.add_argument("--workers", type=int, default=None)
+    export_parser.add_argument("--no-cache", action="store_true", help="render every receipt again")
+    export_parser.set_defaults(func=cmd_export_pdf)
+
+    pdf_cache_parser = commands.add_parser("pdf-cache", help="size of the rendered receipt cache, or empty it")
+    pdf_cache_parser.add_argument("action", choices=("stats", "clear"))
+    pdf_cache_parser.set_defaults(func=cmd_pdf_cache)
+
+    statement_parser = commands.add_parser("statement", help="PDF statement of one client's receipts")
+    statement_parser.add_argument("out")
+    client_group = statement_parser.add_mutually_exclusive_group(required=True)
+    client_group.add_argument("--phone", help="the client's phone number")
+    client_group.add_argument("--name", help="the client's name, for clients without a phone")
+    statement_parser.set_defaults(func=cmd_statement)
+
+    z_report_parser = commands.add_parser("z-report", help="PDF end-of-day report")
+    z_report_parser.add_argument("out")
+    z_report_parser.add_argument("--day", help="YYYY-MM-DD (default: today)")
+    z_report_parser.set_defaults(func=cmd_z_report)
+
+    import_parser = commands.add_parser("import", help="import receipts (or products) from JSON/JSONL")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--products", action="store_true", help="the file holds products")
+    import_parser.set_defaults(func=cmd_import)
+
+    stats_parser = commands.add_parser("stats", help="summary of the stored data")
+    stats_parser.set_defaults(func=cmd_stats)
+
+    report_parser = commands.add_parser("report", help="sales by day or month and top products")
+    report_parser.add_argument("--period", choices=("day", "month"), default="month")
+    report_parser.add_argument("--since", help="only receipts dated on or after YYYY-MM-DD")
+    report_parser.add_argument("--until", help="only receipts dated on or before YYYY-MM-DD")
+    report_parser.add_argument("--top", type=int, default=10, help="number of top products to list")
+    report_parser.add_argument("--top-by", choices=("revenue", "quantity"), default="revenue")
+    report_parser.set_defaults(func=cmd_report)
+
+    aggregates_parser = commands.add_parser("aggregates", help="check or rebuild the daily/monthly totals")
+    aggregates_parser.add_argument("action", choices=("verify", "rebuild"))
+    aggregates_parser.set_defaults(func=cmd_aggregates)
+
+    formats_parser = commands.add_parser("formats", help="check and benchmark the data formats on this history")
+    formats_parser.add_argument("--repeat", type=int, default=3)
+    formats_parser.set_defaults(func=cmd_formats)
+
+    convert_parser = commands.add_parser("convert", help="rewrite the stored data in another format")
+    convert_parser.add_argument("format", choices=sorted(FORMATS))
+    convert_parser.set_defaults(func=cmd_convert)
+
+    args = parser.parse_args(argv)
+    instrumentation.start()
+    dm = get_data_manager(args.data_dir)
+    ready = time.perf_counter()
+    args.func(dm, args)
+    dm.flush()
+    if args.timing:
+        done = time.perf_counter()
+        print(f"imports {(_IMPORTED - _STARTED) * 1000:.1f} ms, "
+              f"startup {(ready - _STARTED) * 1000:.1f} ms, "
+              f"total {(done - _STARTED) * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,574 @@
+import copy
+import itertools
+import json
+import os
+import threading
+from datetime import datetime
+
+from aggregates import SalesAggregates
+from catalog import ProductCatalog
+from instrumentation import instrument_class
+from ledger import ClientLedger
+from pdf_cache import PdfCache
+from pdf_export import TEMPLATE_VERSION
+from pricing import from_cents, to_cents
+from search_index import ClientSearchIndex
+from serializers import dumps, get_format, read_file
+from storage import (apply_product_ops, in_date_range, load_config, open_storage, receipt_header, save_config,
+                     write_atomic)
+from write_behind import WriteBehind
+
+
+@instrument_class("data")
+class DataManager:
+    # Indexes derived from the receipt history. Each one is loaded from
+    # data/<name>.json when the store signature saved with it still matches,
+    # rebuilt otherwise, and then kept current by every receipt mutation.
+    #
+    # Writing them whole takes about a second at 100k receipts, so that is
+    # left to flush(); in between every mutation is appended to
+    # data/derived.jsonl with the store signature after it. A process that
+    # dies before flush() leaves index files plus a log that brings them up
+    # to date, and the next start replays it instead of rebuilding.
+    DERIVED_INDEXES = {
+        'client_index': ClientSearchIndex,
+        'sales_aggregates': SalesAggregates,
+        'client_ledger': ClientLedger,
+    }
+
+    def __init__(self, data_dir="data"):
+        self.data_dir = data_dir
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+        self.config = load_config(self.data_dir)
+        # Whole-file stores commit bursts of changes together; flush()
+        # writes whatever is still waiting
+        self.writer = WriteBehind(self.config['fsync'])
+        self.product_store, self.receipt_store = open_storage(self.data_dir, self.config['storage'],
+                                                              self.config['format'], self.writer)
+        # Parsed data is kept in memory and revalidated against the store's
+        # signature (file mtime/size, or SQLite's change counter) on each read
+        self._lock = threading.RLock()
+        self._products = None
+        self._products_signature = None
+        self._catalog = None
+        self._receipts = None
+        self._receipts_signature = None
+        self._derived = None
+        self._derived_signature = None
+        self._derived_dirty = set()
+        # Whether the index files plus derived.jsonl reproduce self._derived
+        self._derived_logged = False
+        # Rendered receipt PDFs; an entry goes when its receipt changes
+        self.pdf_cache = PdfCache(os.path.join(self.data_dir, "pdf_cache"), TEMPLATE_VERSION)
+
+    def _product_list(self):
+        signature = self.product_store.signature()
+        if self._products is None or signature != self._products_signature:
+            self._products = self.product_store.get_all()
+            self._products_signature = signature
+            self._catalog = None
+        return self._products
+
+    def get_products(self):
+        with self._lock:
+            return list(self._product_list())
+
+    def get_catalog(self):
+        # Indexed view of the products, rebuilt only when they change.
+        # Callers must not modify it; ProductManager works on its own copy.
+        with self._lock:
+            products = self._product_list()
+            if self._catalog is None:
+                self._catalog = ProductCatalog(products)
+            return self._catalog
+
+    def save_product(self, products):
+        with self._lock:
+            self.product_store.save_all(products)
+            self._products = list(products)
+            self._products_signature = self.product_store.signature()
+            self._catalog = None
+
+    def update_products(self, ops):
+        # Persists product edits as deltas (see storage.apply_product_ops)
+        # instead of rewriting the whole catalog
+        with self._lock:
+            products = apply_product_ops(list(self._product_list()), ops)
+            self.product_store.apply(ops)
+            self._products = products
+            self._products_signature = self.product_store.signature()
+            self._catalog = None
+    
+    def _receipt_cache(self):
+        signature = self.receipt_store.signature()
+        if self._receipts is None or signature != self._receipts_signature:
+            self._receipts = {r['id']: r for r in self.receipt_store.get_all()}
+            self._receipts_signature = signature
+        return self._receipts
+
+    def _cached_receipts(self):
+        # The cache if it is loaded and still valid, without loading it
+        if self._receipts is not None and self.receipt_store.signature() == self._receipts_signature:
+            return self._receipts
+        return None
+
+    def _write_through(self, mutate):
+        # Drop the cache if someone else changed the store since we last
+        # looked, otherwise apply the same change to it
+        if self._receipts is not None and self.receipt_store.signature() != self._receipts_signature:
+            self._receipts = None
+        result = mutate()
+        if self._receipts is not None:
+            self._receipts_signature = self.receipt_store.signature()
+        return result
+
+    def get_receipts(self):
+        # Copies, like every read: edits to them must go through
+        # update_receipt, not into the cache
+        with self._lock:
+            return copy.deepcopy(list(self._receipt_cache().values()))
+
+    def _stored_receipt(self, receipt_id):
+        # The current version, not a copy; writes replace cache entries
+        # rather than mutating them, so it stays valid after the write
+        cache = self._cached_receipts()
+        if cache is None:
+            return self.receipt_store.get(receipt_id)
+        return cache[receipt_id]
+
+    def get_receipt(self, receipt_id):
+        with self._lock:
+            cache = self._cached_receipts()
+            if cache is None:
+                return self.receipt_store.get(receipt_id)
+            return copy.deepcopy(cache[receipt_id])
+
+    def count_receipts(self):
+        with self._lock:
+            cache = self._cached_receipts()
+            return len(cache) if cache is not None else self.receipt_store.count()
+
+    def get_receipt_page(self, start, limit):
+        # Newest first. Served from the cache when it is loaded, otherwise
+        # only this page is read from the store.
+        with self._lock:
+            cache = self._cached_receipts()
+            if cache is None:
+                return self.receipt_store.page(start, limit)
+            ids = itertools.islice(reversed(cache), start, start + limit)
+            return [copy.deepcopy(cache[receipt_id]) for receipt_id in ids]
+
+    def get_header_page(self, start, limit):
+        # Like get_receipt_page but only the fields the history grid shows
+        with self._lock:
+            cache = self._cached_receipts()
+            if cache is None:
+                return self.receipt_store.header_page(start, limit)
+            ids = itertools.islice(reversed(cache), start, start + limit)
+            return [receipt_header(cache[receipt_id]) for receipt_id in ids]
+
+    def get_headers(self, receipt_ids):
+        with self._lock:
+            cache = self._cached_receipts()
+            if cache is None:
+                return self.receipt_store.headers(receipt_ids)
+            return [receipt_header(cache[i]) for i in receipt_ids if i in cache]
+
+    def search_receipts(self, query, limit=200):
+        # Headers of receipts whose client name or phone matches, newest first
+        self._prepare_derived()
+        with self._lock:
+            receipt_ids = self._derived_indexes()['client_index'].search(query, limit)
+            return self.get_headers(receipt_ids)
+
+    def iter_receipt_headers(self, page_size=1000):
+        start = 0
+        while True:
+            page = self.get_header_page(start, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            start += page_size
+
+    def iter_receipts(self, page_size=200):
+        # Lazily walks the whole history newest first, one page at a time
+        start = 0
+        while True:
+            page = self.get_receipt_page(start, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            start += page_size
+
+    def get_receipts_between(self, since=None, until=None):
+        # Receipts dated within [since, until] (inclusive YYYY-MM-DD), oldest
+        # id first; stores that partition by date only read what can match.
+        # The lock is only held to snapshot the cache (its entries are
+        # replaced, never changed), so a long scan does not hold up the UI.
+        with self._lock:
+            cache = self._cached_receipts()
+            receipts = None if cache is None else list(cache.values())
+        if receipts is None:
+            return self.receipt_store.receipts_between(since, until)
+        return [copy.deepcopy(r) for r in receipts if in_date_range(r, since, until)]
+
+    def _derived_path(self, name):
+        return os.path.join(self.data_dir, f"{name}.json")
+
+    def _derived_log_path(self):
+        return os.path.join(self.data_dir, "derived.jsonl")
+
+    def _store_signature(self):
+        return json.loads(json.dumps(self.receipt_store.signature()))
+
+    def _read_derived_log(self):
+        # The store signatures the log passes through, from the one it starts
+        # at to the one after its last entry, and the entries; ([], []) when
+        # there is no log or it cannot be read
+        try:
+            with open(self._derived_log_path(), 'rb') as f:
+                lines = f.read().split(b'\n')
+            signatures = [json.loads(lines[0])['base']]
+            entries = []
+            # The last line is empty, or cut off by a crash mid-append
+            for line in lines[1:-1]:
+                entry = json.loads(line)
+                entries.append(entry)
+                signatures.append(entry['signature'])
+        except (OSError, ValueError, KeyError):
+            return [], []
+        return signatures, entries
+
+    def _start_derived_log(self, signature):
+        write_atomic(self._derived_log_path(), (json.dumps({'base': signature}) + '\n').encode('utf-8'))
+        self._derived_logged = True
+
+    def _log_derived(self, entry):
+        try:
+            with open(self._derived_log_path(), 'ab') as f:
+                f.write((json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8'))
+        except OSError:
+            # Written whole by the next checkpoint instead
+            self._derived_logged = False
+
+    def _read_derived(self, signature):
+        # The indexes for `signature`: loaded when saved for it, brought up
+        # to it by replaying derived.jsonl, or rebuilt from the history.
+        # Returns (indexes, names to persist, whether any was rebuilt,
+        # whether the log reaches signature).
+        derived = {}
+        dirty = set()
+        signatures, entries = self._read_derived_log()
+        replayable = bool(signatures) and signatures[-1] == signature
+        rebuilt = False
+        for name, index_class in self.DERIVED_INDEXES.items():
+            index = None
+            path = self._derived_path(name)
+            if os.path.exists(path):
+                saved = read_file(path)
+                if saved.get('signature') == signature:
+                    index = index_class.from_dict(saved['index'])
+                elif replayable and saved.get('signature') in signatures:
+                    index = index_class.from_dict(saved['index'])
+                    for entry in entries[signatures.index(saved['signature']):]:
+                        if 'event' in entry:
+                            getattr(index, entry['event'])(*entry['args'])
+                    dirty.add(name)
+            if index is None:
+                index = index_class.rebuild(self)
+                dirty.add(name)
+                rebuilt = True
+            derived[name] = index
+        return derived, dirty, rebuilt, replayable
+
+    def _install_derived(self, signature, derived, dirty, rebuilt, replayable):
+        self._derived = derived
+        self._derived_dirty = dirty
+        self._derived_signature = signature
+        if rebuilt:
+            # Persisted by the next checkpoint rather than at shutdown
+            self._derived_logged = False
+            self.writer.schedule(self._checkpoint)
+        elif replayable:
+            self._derived_logged = True
+        else:
+            self._start_derived_log(signature)
+
+    def _prepare_derived(self):
+        # Loading the derived indexes, and above all rebuilding them, takes
+        # seconds at 100k receipts. Public methods that need them call this
+        # before taking self._lock, so the work runs without it and screens
+        # reading products or history meanwhile are not held up; the result
+        # is only swapped in if the store did not change in between.
+        for _ in range(3):
+            with self._lock:
+                signature = self._store_signature()
+                if self._derived is not None and signature == self._derived_signature:
+                    return
+            loaded = self._read_derived(signature)
+            with self._lock:
+                if self._store_signature() == signature:
+                    if self._derived is None or self._derived_signature != signature:
+                        self._install_derived(signature, *loaded)
+                    return
+
+    def _derived_indexes(self):
+        # With self._lock held; normally already current after
+        # _prepare_derived(), otherwise loaded under the lock
+        signature = self._store_signature()
+        if self._derived is None or signature != self._derived_signature:
+            self._install_derived(signature, *self._read_derived(signature))
+        return self._derived
+
+    def derived_index(self, name):
+        self._prepare_derived()
+        with self._lock:
+            return self._derived_indexes()[name]
+
+    def rebuild_derived(self, name):
+        # Recompute a derived index from the history; persisted by flush()
+        self._prepare_derived()
+        with self._lock:
+            signature = self._store_signature()
+        index = self.DERIVED_INDEXES[name].rebuild(self)
+        with self._lock:
+            self._derived_indexes()
+            if self._store_signature() != signature:
+                # Changed while rebuilding; redo it against the current store
+                index = self.DERIVED_INDEXES[name].rebuild(self)
+            self._derived[name] = index
+            self._derived_dirty.add(name)
+            # The log would replay onto the saved index being replaced
+            self._derived_logged = False
+            self.writer.schedule(self._checkpoint)
+            return self._derived[name]
+
+    def get_day_totals(self, day):
+        # Count and amounts for a YYYY-MM-DD day, from the aggregates
+        return self.derived_index('sales_aggregates').day(day)
+
+    def get_month_totals(self, month):
+        return self.derived_index('sales_aggregates').month(month)
+
+    def get_period_totals(self, since, until):
+        # Like get_day_totals for the days in [since, until]
+        return self.derived_index('sales_aggregates').between(since, until)
+
+    def get_outstanding_total(self):
+        return self.derived_index('client_ledger').total_outstanding()
+
+    def history_signature(self):
+        # Changes whenever the receipt history does; for callers caching
+        # figures computed from it
+        with self._lock:
+            return self._store_signature()
+
+    def get_outstanding_clients(self):
+        # Clients with a positive balance, largest first, from the ledger
+        return self.derived_index('client_ledger').outstanding()
+
+    def get_client_receipts(self, client_key):
+        # Headers of one ledger client's receipts, newest first
+        self._prepare_derived()
+        with self._lock:
+            return self.get_headers(self._derived_indexes()['client_ledger'].receipt_ids(client_key))
+
+    def get_client(self, client_key):
+        # Name, phone, receipt count and balance of one ledger client;
+        # KeyError for a client with no receipts
+        return self.derived_index('client_ledger').client(client_key)
+
+    def iter_client_receipts(self, client_key, page_size=500):
+        # Headers of one client's receipts, oldest first, a page at a time
+        receipt_ids = self.derived_index('client_ledger').receipt_ids(client_key)[::-1]
+        for start in range(0, len(receipt_ids), page_size):
+            yield from self.get_headers(receipt_ids[start:start + page_size])
+
+    def record_payment(self, receipt_id, amount, date=None):
+        # Adds a follow-up payment to a receipt's payments list and lowers
+        # its balance; stored as one receipt update like any other edit
+        self._prepare_derived()
+        with self._lock:
+            receipt = self.get_receipt(receipt_id)
+            cents = to_cents(amount)
+            balance = to_cents(receipt['balance_due'])
+            if cents <= 0:
+                raise ValueError("Payment must be positive")
+            if cents > balance:
+                raise ValueError("Payment exceeds the balance due")
+            receipt.setdefault('payments', []).append({
+                'date': date or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'amount': from_cents(cents),
+            })
+            receipt['balance_due'] = from_cents(balance - cents)
+            self.update_receipt(receipt_id, receipt)
+            return receipt
+
+    def _notify(self, event, *args):
+        for name, index in self._derived.items():
+            getattr(index, event)(*args)
+            self._derived_dirty.add(name)
+        self._derived_signature = self._store_signature()
+        if self._derived_logged:
+            self._log_derived({'event': event, 'args': args, 'signature': self._derived_signature})
+        self.writer.schedule(self._checkpoint)
+
+    def _checkpoint(self, durable=False):
+        # Write-behind commit, run after the stores' own. Flushing re-bases a
+        # buffered store's signature on its files, and the log records that,
+        # so a process killed before flush() still finds its indexes current.
+        # Indexes the log cannot reproduce (just rebuilt) are written whole.
+        with self._lock:
+            if self._derived is None:
+                return
+            if not self._derived_logged:
+                self.flush()
+                return
+            self._flush_stores()
+
+    def _flush_stores(self, roll=False):
+        before = (self.product_store.signature(), self.receipt_store.signature())
+        for store in (self.product_store, self.receipt_store):
+            if hasattr(store, 'flush'):
+                store.flush()
+        # A partitioned store folds ended months into segments, only while
+        # derived.jsonl can record the signature that leaves it with
+        if roll and self._derived_logged and hasattr(self.receipt_store, 'roll'):
+            self.receipt_store.roll()
+        # Flushing re-bases a buffered store's signature on its files, and a
+        # roll moves receipts between files; what was cached against the
+        # old signature is still current
+        products, receipts = self.product_store.signature(), self.receipt_store.signature()
+        if self._products_signature == before[0]:
+            self._products_signature = products
+        if self._receipts_signature == before[1]:
+            self._receipts_signature = receipts
+        if self._derived is not None and self._derived_signature == json.loads(json.dumps(before[1])):
+            self._derived_signature = self._store_signature()
+            if self._derived_logged and self._derived_signature != json.loads(json.dumps(before[1])):
+                self._log_derived({'signature': self._derived_signature})
+
+    def flush(self):
+        # Write store changes still waiting on the write-behind timer, then
+        # persist derived indexes that changed, stamped with the store state
+        # they reflect, and start a new log from there; called on shutdown
+        with self._lock:
+            self._flush_stores(roll=True)
+            if not self._derived_dirty:
+                return
+            signature = self._store_signature()
+            for name in self._derived_dirty:
+                write_atomic(self._derived_path(name), dumps(
+                    {'signature': signature, 'index': self._derived[name].to_dict()}, self.config['format']
+                ))
+            self._derived_dirty = set()
+            self._start_derived_log(signature)
+
+    def convert_format(self, file_format):
+        # Rewrites the whole-file data (the JSON product store, receipts.json
+        # and the derived indexes) in another serializers format and records
+        # it in config.json. Everything rewritten is read back and compared;
+        # on a mismatch the original files are put back and ValueError raised.
+        # Journals stay JSON lines; partition segments and record bodies
+        # change format as they are next written.
+        get_format(file_format)
+        self._prepare_derived()
+        with self._lock:
+            self.flush()
+            stores = [store for store in (self.product_store, self.receipt_store) if hasattr(store, 'file_format')]
+            rewritten = [store for store in stores if hasattr(store, 'save_all')]
+            paths = [self._derived_path(name) for name in self.DERIVED_INDEXES] + [self._derived_log_path()]
+            for store in rewritten:
+                paths += [store.path, getattr(store, 'ops_path', None)]
+            originals = {}
+            for path in filter(None, paths):
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        originals[path] = f.read()
+            previous = self.config['format']
+            # Loaded before the rewrite, while their saved signatures match
+            self._derived_indexes()
+            try:
+                for store in stores:
+                    store.file_format = file_format
+                for store in rewritten:
+                    data = store.get_all()
+                    store.save_all(data)
+                    store.flush()
+                    # Read back from the files, not the in-memory copy
+                    store.discard()
+                    if store.get_all() != data:
+                        raise ValueError(f"{store.path} did not read back the same in {file_format}")
+                self.config['format'] = file_format
+                self._derived_signature = self._store_signature()
+                self._derived_dirty = set(self._derived)
+                self.flush()
+                for name, index in self._derived.items():
+                    expected = json.loads(json.dumps(index.to_dict()))
+                    if read_file(self._derived_path(name))['index'] != expected:
+                        raise ValueError(f"{name} did not read back the same in {file_format}")
+            except Exception:
+                for store in stores:
+                    store.file_format = previous
+                self.config['format'] = previous
+                for path, data in originals.items():
+                    write_atomic(path, data)
+                for store in rewritten:
+                    store.discard()
+                self._derived = None
+                raise
+            config = load_config(self.data_dir, environ=False)
+            config['format'] = file_format
+            save_config(self.data_dir, config)
+
+    def save_receipt(self, receipt):
+        # Assigns receipt['id'] and returns it
+        def mutate():
+            receipt_id = self.receipt_store.append(receipt)
+            if self._receipts is not None:
+                self._receipts[receipt_id] = copy.deepcopy(receipt)
+            return receipt_id
+        self._prepare_derived()
+        with self._lock:
+            self._derived_indexes()
+            receipt_id = self._write_through(mutate)
+            self._notify('receipt_saved', receipt)
+            return receipt_id
+
+    def delete_receipt(self, receipt_id):
+        def mutate():
+            self.receipt_store.delete(receipt_id)
+            if self._receipts is not None:
+                del self._receipts[receipt_id]
+        self._prepare_derived()
+        with self._lock:
+            self._derived_indexes()
+            old_receipt = self._stored_receipt(receipt_id)
+            self._write_through(mutate)
+            self._notify('receipt_deleted', old_receipt)
+            self.pdf_cache.discard(old_receipt)
+
+    def update_receipt(self, receipt_id, receipt):
+        def mutate():
+            self.receipt_store.update(receipt_id, receipt)
+            if self._receipts is not None:
+                self._receipts[receipt_id] = copy.deepcopy(receipt)
+        self._prepare_derived()
+        with self._lock:
+            self._derived_indexes()
+            old_receipt = self._stored_receipt(receipt_id)
+            self._write_through(mutate)
+            self._notify('receipt_updated', old_receipt, receipt)
+            self.pdf_cache.discard(old_receipt)
+
+
+_shared_managers = {}
+
+
+def get_data_manager(data_dir="data"):
+    # Every screen shares one DataManager (and its cache) per data directory
+    key = os.path.abspath(data_dir)
+    if key not in _shared_managers:
+        _shared_managers[key] = DataManager(data_dir)
+    return _shared_managers[key]
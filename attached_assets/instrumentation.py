@@ -0,0 +1,205 @@
+import atexit
+import functools
+import inspect
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+from storage import write_atomic
+
+# Opt-in timing of the hot paths, switched on per session:
+#   OPTICAL_METRICS=1           spans and counters, exported to data/metrics.json
+#   OPTICAL_METRICS=<path>      the same, exported to <path>
+#   OPTICAL_PROFILE=<path>      the session's main thread under cProfile,
+#                               stats dumped to <path> on exit
+# Everything is decided when modules are imported: with OPTICAL_METRICS
+# unset, timed() and instrument_class() hand back the original functions,
+# so a normal session runs exactly the code it would without this module.
+EXPORT_INTERVAL = 30
+
+
+def _metrics_file():
+    value = os.environ.get("OPTICAL_METRICS", "")
+    if value in ("", "0"):
+        return None
+    return os.path.join("data", "metrics.json") if value == "1" else value
+
+
+METRICS_FILE = _metrics_file()
+ENABLED = METRICS_FILE is not None
+
+
+class Histogram:
+    # Latencies counted in log-spaced buckets, BUCKETS_PER_DOUBLING per
+    # power of two from 1 µs, so percentiles come out within about 20% in
+    # constant memory however many calls are recorded
+    BUCKETS_PER_DOUBLING = 4
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        micros = seconds * 1e6
+        index = int(math.log2(micros) * self.BUCKETS_PER_DOUBLING) if micros > 1 else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent):
+        # Upper bound of the bucket holding the percent-th latency, in seconds
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(2 ** ((index + 1) / self.BUCKETS_PER_DOUBLING) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.spans = {}
+        self.counters = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self.spans.get(name)
+            if histogram is None:
+                histogram = self.spans[name] = Histogram()
+            histogram.add(seconds)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'exported': time.time(),
+                'spans': {name: histogram.summary() for name, histogram in sorted(self.spans.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def export(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        write_atomic(path, json.dumps(self.snapshot(), indent=2).encode('utf-8'))
+
+
+metrics = Metrics()
+
+
+class _Span:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics.record(self.name, time.perf_counter() - self.started)
+        if exc_type is not None:
+            metrics.increment(self.name + ".errors")
+        return False
+
+
+_NO_SPAN = nullcontext()
+
+
+def span(name):
+    # with span("pdf.export"): ... times the block while enabled
+    return _Span(name) if ENABLED else _NO_SPAN
+
+
+def timed(name):
+    # Decorator timing every call of a function under `name`; returns the
+    # function untouched when instrumentation is off
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                metrics.increment(name + ".errors")
+                raise
+            finally:
+                metrics.record(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def instrument_class(prefix):
+    # Class decorator putting a span named <prefix>.<method> around every
+    # public method. Generator methods are left alone: their time is spent
+    # by whoever iterates them.
+    def decorate(cls):
+        if not ENABLED:
+            return cls
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith('_') or not inspect.isfunction(value) or inspect.isgeneratorfunction(value):
+                continue
+            setattr(cls, attr, timed(f"{prefix}.{attr}")(value))
+        return cls
+    return decorate
+
+
+def _export_loop(stop):
+    while not stop.wait(EXPORT_INTERVAL):
+        metrics.export(METRICS_FILE)
+
+
+def start():
+    # Called once by the entry points (the app and cli.py): starts the
+    # periodic metrics export and the session profiler when switched on
+    if ENABLED:
+        stop = threading.Event()
+        threading.Thread(target=_export_loop, args=(stop,), daemon=True).start()
+
+        def final_export():
+            stop.set()
+            metrics.export(METRICS_FILE)
+        atexit.register(final_export)
+    profile_path = os.environ.get("OPTICAL_PROFILE")
+    if profile_path:
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+
+        def dump():
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            print(f"Profile written to {profile_path}; top functions by cumulative time:", file=sys.stderr)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+        atexit.register(dump)
+        profiler.enable()
@@ -0,0 +1,83 @@
+from pricing import from_cents, to_cents
+from search_index import normalize_name, normalize_phone
+
+
+def client_key(receipt):
+    # Clients are identified by phone digits, or by name when no phone was
+    # taken, so "06 12 34" and "061234" are the same client
+    phone = normalize_phone(receipt['client_phone'])
+    return phone if phone else "name:" + normalize_name(receipt['client_name'])
+
+
+class ClientLedger:
+    # Per-client receipt ids and outstanding balance (the sum of positive
+    # balance_due, in cents), adjusted by each receipt change rather than
+    # recomputed from the history.
+    def __init__(self):
+        self.clients = {}
+
+    @classmethod
+    def build(cls, receipts):
+        ledger = cls()
+        for receipt in receipts:
+            ledger.receipt_saved(receipt)
+        return ledger
+
+    @classmethod
+    def rebuild(cls, data_manager):
+        return cls.build(data_manager.iter_receipt_headers())
+
+    def receipt_saved(self, receipt):
+        client = self.clients.setdefault(client_key(receipt), {
+            'name': receipt['client_name'], 'phone': receipt['client_phone'],
+            'last_id': receipt['id'], 'receipt_ids': set(), 'outstanding': 0,
+        })
+        # The most recent receipt names the client
+        if receipt['id'] >= client['last_id']:
+            client['name'] = receipt['client_name']
+            client['phone'] = receipt['client_phone']
+            client['last_id'] = receipt['id']
+        client['receipt_ids'].add(receipt['id'])
+        client['outstanding'] += max(to_cents(receipt['balance_due']), 0)
+
+    def receipt_updated(self, old_receipt, receipt):
+        self.receipt_deleted(old_receipt)
+        self.receipt_saved(receipt)
+
+    def receipt_deleted(self, old_receipt):
+        key = client_key(old_receipt)
+        client = self.clients[key]
+        client['receipt_ids'].discard(old_receipt['id'])
+        client['outstanding'] -= max(to_cents(old_receipt['balance_due']), 0)
+        if not client['receipt_ids']:
+            del self.clients[key]
+
+    def receipt_ids(self, key):
+        return sorted(self.clients[key]['receipt_ids'], reverse=True)
+
+    def _row(self, key, client):
+        return {'key': key, 'name': client['name'], 'phone': client['phone'],
+                'receipts': len(client['receipt_ids']), 'outstanding': from_cents(client['outstanding'])}
+
+    def client(self, key):
+        return self._row(key, self.clients[key])
+
+    def total_outstanding(self):
+        return from_cents(sum(client['outstanding'] for client in self.clients.values()))
+
+    def outstanding(self):
+        # Clients who still owe money, largest balance first
+        rows = [self._row(key, client) for key, client in self.clients.items() if client['outstanding'] > 0]
+        rows.sort(key=lambda row: row['outstanding'], reverse=True)
+        return rows
+
+    def to_dict(self):
+        return {key: dict(client, receipt_ids=sorted(client['receipt_ids']))
+                for key, client in self.clients.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        ledger = cls()
+        ledger.clients = {key: dict(client, receipt_ids=set(client['receipt_ids']))
+                          for key, client in data.items()}
+        return ledger
@@ -1,60 +1,21 @@
-import json
-import os
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from datetime import datetime
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+from datetime import datetime, timedelta
 import customtkinter as ctk
+from catalog import ProductCatalog
+from data_manager import get_data_manager
+from pricing import ReceiptPricing, format_money, from_cents, price_receipt, to_cents
+from pdf_export import export_receipts, generate_statement, generate_z_report, save_receipt_pdf
+from background import TaskQueue
+import instrumentation
+from instrumentation import timed
 # Add after the imports
 # Add after the imports
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
 # Define custom colors and styles
 
-class DataManager:
-    def __init__(self):
-        self.data_dir = "data"
-        self.products_file = os.path.join(self.data_dir, "products.json")
-        self.receipts_file = os.path.join(self.data_dir, "receipts.json")
-        self._initialize_data_files()
-
-    def _initialize_data_files(self):
-        if not os.path.exists(self.data_dir):
-            os.makedirs(self.data_dir)
-        for file in [self.products_file, self.receipts_file]:
-            if not os.path.exists(file):
-                with open(file, 'w') as f:
-                    json.dump([], f)
-
-    def get_products(self):
-        with open(self.products_file, 'r') as f:
-            return json.load(f)
-
-    def save_product(self, products):
-        with open(self.products_file, 'w') as f:
-            json.dump(products, f)
-    
-    def get_receipts(self):
-        with open(self.receipts_file, 'r') as f:
-            return json.load(f)
-
-    def save_receipt(self, receipt):
-        receipts = self.get_receipts()
-        receipts.append(receipt)
-        with open(self.receipts_file, 'w') as f:
-            json.dump(receipts, f)
-    def delete_receipt(self, index):
-        receipts = self.get_receipts()
-        receipts.pop(index)
-        with open(self.receipts_file, 'w') as f:
-            json.dump(receipts, f)
-
-    def update_receipt(self, index, receipt):
-        receipts = self.get_receipts()
-        receipts[index] = receipt
-        with open(self.receipts_file, 'w') as f:
-            json.dump(receipts, f)
 class MainApplication(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -92,7 +53,8 @@ class MainApplication(ctk.CTk):
             ("🏠 Home", "HomeFrame"),
             ("📦 Product Management", "ProductManager"),
             ("📝 Generate Receipt", "ReceiptGenerator"),
-            ("📋 Receipt History", "ReceiptHistory")
+            ("📋 Receipt History", "ReceiptHistory"),
+            ("💰 Outstanding Balances", "OutstandingBalances")
         ]
         
         for idx, (text, frame_name) in enumerate(nav_buttons):
@@ -114,16 +76,58 @@ class MainApplication(ctk.CTk):
         self.content.grid_rowconfigure(0, weight=1)
         self.content.grid_columnconfigure(0, weight=1)
         
-        # Initialize frames
+        # Background worker for saves and PDF rendering
+        self.tasks = TaskQueue()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        # Not in the sidebar: opened with Ctrl+Shift+D when chasing slowness
+        self.bind_all("<Control-D>", lambda e: self.show_diagnostics())
+        self.diagnostics = None
+        
+        self.configure_treeview_style()
+        
+        # Frames are built on first navigation, so startup does not depend on
+        # how many products or receipts are stored
+        self.frame_classes = {
+            F.__name__: F for F in (HomeFrame, ProductManager, ReceiptGenerator, ReceiptHistory, OutstandingBalances)
+        }
         self.frames = {}
-        for F in (HomeFrame, ProductManager, ReceiptGenerator, ReceiptHistory):
-            frame = F(self.content, self)
-            self.frames[F.__name__] = frame
-            frame.grid(row=0, column=0, sticky="nsew")
         
         self.show_frame("HomeFrame")
 
+    def configure_treeview_style(self):
+        style = ttk.Style()
+        style.configure(
+            "Treeview",
+            background=self.COLORS['background'],
+            foreground=self.COLORS['text'],
+            rowheight=25,
+            fieldbackground=self.COLORS['background']
+        )
+        style.configure(
+            "Treeview.Heading",
+            background=self.COLORS['primary'],
+            foreground="white",
+            relief="flat"
+        )
+        style.map("Treeview.Heading",
+                 background=[('active', self.COLORS['secondary'])])
+
+    def show_diagnostics(self):
+        if self.diagnostics is None or not self.diagnostics.winfo_exists():
+            self.diagnostics = DiagnosticsPanel(self)
+        self.diagnostics.lift()
+
+    def on_close(self):
+        # Let queued saves finish before the process exits
+        self.tasks.join()
+        get_data_manager().flush()
+        self.destroy()
+
     def show_frame(self, page_name):
+        if page_name not in self.frames:
+            frame = self.frame_classes[page_name](self.content, self)
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.frames[page_name] = frame
         frame = self.frames[page_name]
         frame.tkraise()
         if hasattr(frame, "on_show"):
@@ -167,6 +171,94 @@ class HomeFrame(ctk.CTkFrame):
             "View receipt history",
             "📋", "ReceiptHistory"
         )
+        
+        # Sales panel, filled in the background by on_show
+        sales = ctk.CTkFrame(self)
+        sales.grid(row=2, column=0, sticky="ew", padx=20, pady=20)
+        sales.grid_columnconfigure((0,1,2,3), weight=1)
+        self.sales_vars = {}
+        for col, (key, title) in enumerate((("today", "Today"), ("month", "This Month"),
+                                            ("year", "Last 12 Months"), ("outstanding", "Outstanding"))):
+            ctk.CTkLabel(sales, text=title, font=self.controller.STYLES['normal']).grid(row=0, column=col, pady=(10,0))
+            self.sales_vars[key] = ctk.StringVar(value="...")
+            ctk.CTkLabel(
+                sales, textvariable=self.sales_vars[key],
+                font=self.controller.STYLES['subheading']
+            ).grid(row=1, column=col, pady=(0,10))
+        self.top_products_var = ctk.StringVar()
+        ctk.CTkLabel(sales, textvariable=self.top_products_var, justify="left").grid(
+            row=2, column=0, columnspan=4, pady=(0,10))
+        self._sales_result = None
+        self._sales_loading = False
+        self._sales_key = None
+        self._sales_cached = None
+
+    def on_show(self):
+        if self._sales_loading:
+            return
+        self._sales_loading = True
+        self._sales_result = None
+
+        # Off the Tk thread, as the first call after a start may have to
+        # load the derived indexes
+        def run():
+            try:
+                self._sales_result = self.compute_sales()
+            except Exception as e:
+                self._sales_result = e
+
+        threading.Thread(target=run, daemon=True).start()
+        self.poll_sales()
+
+    def compute_sales(self):
+        # Every figure but the top products comes from the maintained sales
+        # aggregates and ledger; the top products need this month's receipt
+        # bodies and the NumPy analytics. The result is reused until the
+        # history changes or the day does.
+        data_manager = get_data_manager()
+        today = datetime.now().date()
+        key = (today, data_manager.history_signature())
+        if key == self._sales_key:
+            return self._sales_cached
+        result = {
+            'today': data_manager.get_day_totals(today.isoformat()),
+            'month': data_manager.get_month_totals(today.isoformat()[:7]),
+            'year': data_manager.get_period_totals((today - timedelta(days=365)).isoformat(), today.isoformat()),
+            'outstanding': data_manager.get_outstanding_total(),
+            'top': None,
+        }
+        try:
+            from analytics import SalesData
+        except ImportError:
+            pass
+        else:
+            result['top'] = SalesData.load(data_manager, since=today.replace(day=1).isoformat()).top_products(limit=5)
+        self._sales_key, self._sales_cached = key, result
+        return result
+
+    def poll_sales(self):
+        result = self._sales_result
+        if result is None:
+            self.after(200, self.poll_sales)
+            return
+        self._sales_loading = False
+        if isinstance(result, Exception):
+            for var in self.sales_vars.values():
+                var.set("-")
+            self.top_products_var.set(f"Sales figures unavailable: {result}")
+            return
+        for key in ("today", "month", "year"):
+            totals = result[key]
+            self.sales_vars[key].set(f"{format_money(totals['total'])} ({totals['count']})")
+        self.sales_vars['outstanding'].set(format_money(result['outstanding']))
+        if result['top'] is None:
+            self.top_products_var.set("Install numpy for top products")
+        elif result['top']:
+            self.top_products_var.set("Top products this month: " + ", ".join(
+                f"{row['product']} ({row['quantity']})" for row in result['top']
+            ))
+        else:
+            self.top_products_var.set("No sales this month yet")
 
     def create_dashboard_card(self, parent, col, title, description, icon, target):
         card = ctk.CTkFrame(parent)
@@ -196,26 +288,9 @@ class ProductManager(ctk.CTkFrame):
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
-        self.data_manager = DataManager()
-        self.products = self.data_manager.get_products()
-        # Add to each class's __init__ method:
-        # Style the Treeview
-        style = ttk.Style()
-        style.configure(
-            "Treeview",
-            background=self.controller.COLORS['background'],
-            foreground=self.controller.COLORS['text'],
-            rowheight=25,
-            fieldbackground=self.controller.COLORS['background']
-        )
-        style.configure(
-            "Treeview.Heading",
-            background=self.controller.COLORS['primary'],
-            foreground="white",
-            relief="flat"
-        )
-        style.map("Treeview.Heading",
-                 background=[('active', self.controller.COLORS['secondary'])])
+        self.data_manager = get_data_manager()
+        # Products are loaded by on_show
+        self.catalog = ProductCatalog()
         # Create widgets
         self.tree = ttk.Treeview(self, columns=('Name', 'Price'), show='headings')
         self.tree.heading('Name', text='Product Name')
@@ -231,8 +306,6 @@ class ProductManager(ctk.CTkFrame):
         # Layout
         self.tree.pack(fill="both", expand=True, padx=20, pady=10)
         btn_frame.pack(pady=10)
-        
-        self.load_products()
     def move_up(self):
         selected = self.tree.selection()
         if not selected:
@@ -240,32 +313,36 @@ class ProductManager(ctk.CTkFrame):
         index = self.tree.index(selected[0])
         if index > 0:
             # Swap in data list
-            self.products[index], self.products[index-1] = self.products[index-1], self.products[index]
-            # Update treeview
-            self.data_manager.save_product(self.products)
-            self.load_products()
-            self.tree.selection_set(self.tree.get_children()[index-1])
+            self.catalog.swap(index, index-1)
+            self.data_manager.update_products([{'op': 'move', 'name': self.catalog.products[index-1]['name'], 'to': index-1}])
+            # Update treeview; the moved row keeps its selection
+            self.tree.move(selected[0], '', index-1)
+            self.tree.see(selected[0])
     def move_down(self):
         selected = self.tree.selection()
         if not selected:
             return
         index = self.tree.index(selected[0])
-        if index < len(self.products) - 1:
+        if index < len(self.catalog) - 1:
             # Swap in data list
-            self.products[index], self.products[index+1] = self.products[index+1], self.products[index]
-            # Update treeview
-            self.data_manager.save_product(self.products)
-            self.load_products()
-            self.tree.selection_set(self.tree.get_children()[index+1])
+            self.catalog.swap(index, index+1)
+            self.data_manager.update_products([{'op': 'move', 'name': self.catalog.products[index+1]['name'], 'to': index+1}])
+            # Update treeview; the moved row keeps its selection
+            self.tree.move(selected[0], '', index+1)
+            self.tree.see(selected[0])
     def on_show(self):
-        self.products = self.data_manager.get_products()
+        self.catalog = ProductCatalog(self.data_manager.get_products())
         self.load_products()
 
+    @timed("ui.load_products")
     def load_products(self):
         for item in self.tree.get_children():
             self.tree.delete(item)
-        for product in self.products:
-            self.tree.insert('', tk.END, values=(product['name'], f"${product['price']:.2f}"))
+        for product in self.catalog.products:
+            self.tree.insert('', tk.END, values=self.row_values(product))
+
+    def row_values(self, product):
+        return (product['name'], format_money(product['price']))
 
     def add_product(self):
         self._product_dialog("Add Product")
@@ -274,10 +351,11 @@ class ProductManager(ctk.CTkFrame):
         selected = self.tree.selection()
         if not selected:
             return
-        values = self.tree.item(selected[0], 'values')
-        self._product_dialog("Edit Product", values[0], float(values[1][1:]))
+        # Rows are kept in catalog order
+        product = self.catalog.products[self.tree.index(selected[0])]
+        self._product_dialog("Edit Product", product['name'], product['price'], item=selected[0])
 
-    def _product_dialog(self, title, name="", price=0.0):
+    def _product_dialog(self, title, name="", price=0.0, item=None):
         dialog = ctk.CTkToplevel(self)
         dialog.title(title)
         
@@ -297,16 +375,26 @@ class ProductManager(ctk.CTkFrame):
                     'name': name_entry.get(),
                     'price': float(price_entry.get())
                 }
-                if title == "Add Product":
-                    self.products.append(new_product)
-                else:
-                    index = next(i for i, p in enumerate(self.products) if p['name'] == name)
-                    self.products[index] = new_product
-                self.data_manager.save_product(self.products)
-                self.load_products()
-                dialog.destroy()
             except ValueError:
                 messagebox.showerror("Error", "Invalid price format")
+                return
+            try:
+                if item is None:
+                    self.catalog.add(new_product)
+                    op = {'op': 'add', 'product': new_product}
+                else:
+                    self.catalog.replace(name, new_product)
+                    op = {'op': 'set', 'name': name, 'product': new_product}
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self.data_manager.update_products([op])
+            # Only the affected row is touched
+            if item is None:
+                self.tree.see(self.tree.insert('', tk.END, values=self.row_values(new_product)))
+            else:
+                self.tree.item(item, values=self.row_values(new_product))
+            dialog.destroy()
 
         ctk.CTkButton(dialog, text="Save", command=save).grid(row=2, columnspan=2, pady=10)
 
@@ -314,17 +402,22 @@ class ProductManager(ctk.CTkFrame):
         selected = self.tree.selection()
         if not selected:
             return
-        name = self.tree.item(selected[0], 'values')[0]
-        self.products = [p for p in self.products if p['name'] != name]
-        self.data_manager.save_product(self.products)
-        self.load_products()
+        name = self.catalog.products[self.tree.index(selected[0])]['name']
+        self.catalog.remove(name)
+        self.data_manager.update_products([{'op': 'del', 'name': name}])
+        self.tree.delete(selected[0])
 
 class ReceiptGenerator(ctk.CTkFrame):
+    # Most product names offered in the dropdown at once
+    SUGGESTION_LIMIT = 50
+
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
-        self.data_manager = DataManager()
+        self.data_manager = get_data_manager()
         self.receipt_items = []
+        self.pricing = ReceiptPricing()
+        self._total_job = None
         
         # Create widgets
         main_frame = ctk.CTkFrame(self)
@@ -365,9 +458,10 @@ class ReceiptGenerator(ctk.CTkFrame):
         product_frame.pack(fill="x", pady=5)
         
         self.product_var = ctk.StringVar()
-        products = [p['name'] for p in self.data_manager.get_products()]
-        self.product_cb = ctk.CTkComboBox(product_frame, variable=self.product_var, values=products)
+        # Filled from the catalog by on_show
+        self.product_cb = ctk.CTkComboBox(product_frame, variable=self.product_var, values=[])
         self.product_cb.pack(side="left", padx=5)
+        self.product_var.trace_add("write", lambda *args: self.update_product_suggestions())
         
         self.qty_var = ctk.StringVar(value="1")
         ctk.CTkEntry(product_frame, textvariable=self.qty_var, width=50).pack(side="left", padx=5)
@@ -441,10 +535,16 @@ class ReceiptGenerator(ctk.CTkFrame):
         ctk.CTkButton(right_payment, text="Save Receipt", command=self.save_receipt, width=100).pack(side="left", padx=5)
         ctk.CTkButton(right_payment, text="Cancel", command=lambda: self.controller.show_frame("HomeFrame"), width=100).pack(side="left", padx=5)
         
+        # Background save status
+        self.task_status_var = ctk.StringVar()
+        self.last_saved_message = ""
+        self._polling = False
+        ctk.CTkLabel(main_frame, textvariable=self.task_status_var).pack(anchor="e")
+        
         # Bind payment updates
-        self.discount_var.trace_add("write", lambda *args: self.update_total())
-        self.advance_var.trace_add("write", lambda *args: self.update_total())
-        self.num_discount_var.trace_add("write", lambda *args: self.update_total())
+        self.discount_var.trace_add("write", lambda *args: self.schedule_adjustments())
+        self.advance_var.trace_add("write", lambda *args: self.schedule_adjustments())
+        self.num_discount_var.trace_add("write", lambda *args: self.schedule_adjustments())
 
     def add_assurance_tax(self):
         dialog = ctk.CTkToplevel(self)
@@ -493,8 +593,7 @@ class ReceiptGenerator(ctk.CTkFrame):
             messagebox.showerror("Error", "Invalid quantity")
             return
         
-        products = self.data_manager.get_products()
-        product = next((p for p in products if p['name'] == product_name), None)
+        product = self.data_manager.get_catalog().get(product_name)
         if not product:
             messagebox.showerror("Error", "Product not found")
             return
@@ -519,6 +618,7 @@ class ReceiptGenerator(ctk.CTkFrame):
     def delete_item(self, item):
         idx = self.tree.index(item)
         self.receipt_items.pop(idx)
+        self.pricing.remove_line(idx)
         self.tree.delete(item)
         self.update_total()
 
@@ -565,7 +665,8 @@ class ReceiptGenerator(ctk.CTkFrame):
         ctk.CTkButton(dialog, text="Add", command=save, width=200).pack(pady=30)
 
     def add_item_to_receipt(self, product_name, price, qty=1):
-        total = price * qty
+        total = from_cents(self.pricing.add_line(qty, price))
+        price = from_cents(to_cents(price))
         self.receipt_items.append({
             'product': product_name,
             'quantity': qty,
@@ -576,29 +677,31 @@ class ReceiptGenerator(ctk.CTkFrame):
         self.tree.insert('', tk.END, values=(
             product_name,
             qty,
-            f"${price:.2f}",
-            f"${total:.2f}",
+            format_money(price),
+            format_money(total),
             "❌"
         ))
         self.update_total()
 
-    def update_total(self):
-        subtotal = sum(item['total'] for item in self.receipt_items)
+    def schedule_adjustments(self):
+        # Recompute once typing in the discount/advance fields pauses
+        if self._total_job is not None:
+            self.after_cancel(self._total_job)
+        self._total_job = self.after(150, self.apply_adjustments)
+
+    def apply_adjustments(self):
+        self._total_job = None
         try:
-            discount = float(self.discount_var.get() or 0)
-            num_discount = float(self.num_discount_var.get() or 0)
-            advance = float(self.advance_var.get() or 0)
+            self.pricing.set_adjustments(self.discount_var.get(), self.num_discount_var.get(),
+                                         self.advance_var.get())
         except ValueError:
-            discount = 0
-            num_discount = 0
-            advance = 0
-            
-        total_after_percent = subtotal * (1 - discount/100)
-        total = max(total_after_percent - num_discount, 0)  # Prevent negative totals
-        balance = total - advance
-        
-        self.total_var.set(f"Total: ${total:.2f}")
-        self.balance_var.set(f"Balance Due: ${balance:.2f}")
+            self.pricing.set_adjustments(0, 0, 0)
+        self.update_total()
+
+    @timed("ui.update_total")
+    def update_total(self):
+        self.total_var.set(f"Total: {format_money(from_cents(self.pricing.total()))}")
+        self.balance_var.set(f"Balance Due: {format_money(from_cents(self.pricing.balance_due()))}")
 
     def edit_item(self, event):
         item = self.tree.selection()[0]
@@ -640,8 +743,9 @@ class ReceiptGenerator(ctk.CTkFrame):
                 qty = int(qty_entry.get())
                 price = float(price_entry.get())
                 if name and qty > 0 and price >= 0:
-                    total = qty * price
-                    self.tree.item(item, values=(name, qty, f"${price:.2f}", f"${total:.2f}", "❌"))
+                    total = from_cents(self.pricing.set_line(idx, qty, price))
+                    price = from_cents(to_cents(price))
+                    self.tree.item(item, values=(name, qty, format_money(price), format_money(total), "❌"))
                     self.receipt_items[idx] = {
                         'product': name,
                         'quantity': qty,
@@ -657,15 +761,22 @@ class ReceiptGenerator(ctk.CTkFrame):
         
         ctk.CTkButton(dialog, text="Save", command=save, width=200).pack(pady=30)
 
+    @timed("ui.save_receipt")
     def save_receipt(self):
         if not self.receipt_items:
             messagebox.showerror("Error", "No items in receipt")
             return
         
+        # Pick up adjustments typed within the debounce delay
+        if self._total_job is not None:
+            self.after_cancel(self._total_job)
+            self._total_job = None
         try:
-            advance = float(self.advance_var.get() or 0)
+            self.pricing.set_adjustments(self.discount_var.get(), self.num_discount_var.get(),
+                                         self.advance_var.get())
         except ValueError:
-            advance = 0
+            messagebox.showerror("Error", "Invalid discount or advance amount")
+            return
             
         receipt = {
             'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -682,110 +793,335 @@ class ReceiptGenerator(ctk.CTkFrame):
                 'axe': self.left_axe.get()
             },
             'items': self.receipt_items,
-            'subtotal': sum(item['total'] for item in self.receipt_items),
-            'discount': float(self.discount_var.get() or 0),
-            'numerical_discount': float(self.num_discount_var.get() or 0),
-            'advance_payment': advance,
-            'total': sum(item['total'] for item in self.receipt_items) * (1 - float(self.discount_var.get() or 0)/100),
-            'balance_due': sum(item['total'] for item in self.receipt_items) * (1 - float(self.discount_var.get() or 0)/100) - advance
+            **self.pricing.summary()
         }
         
-        self.data_manager.save_receipt(receipt)
-        self.generate_pdf(receipt)
-        messagebox.showinfo("Success", "Receipt saved successfully")
-        self.controller.show_frame("HomeFrame")
-   
-    def generate_pdf(self, receipt):
+        # Ask for the PDF path now; saving and rendering happen on the worker
+        # so the form can be cleared for the next client straight away. The
+        # callback keeps the receipt so a failed save can be put back.
         file_path = filedialog.asksaveasfilename(
             defaultextension=".pdf",
             filetypes=[("PDF Files", "*.pdf")]
         )
+        self.controller.tasks.submit(
+            self.persist_receipt, receipt, file_path,
+            callback=lambda result, error: self.on_receipt_saved(receipt, result, error)
+        )
+        self.on_show()
+        self.update_task_status()
+        self.poll_tasks()
+
+    def persist_receipt(self, receipt, file_path):
+        # Runs on the background worker thread. A PDF failure is returned
+        # rather than raised: the receipt itself is saved by then.
+        receipt_id = self.data_manager.save_receipt(receipt)
+        pdf_error = None
         if file_path:
-            generate_pdf_from_receipt(receipt, file_path)
+            try:
+                save_receipt_pdf(receipt, file_path, self.data_manager.pdf_cache)
+            except Exception as e:
+                pdf_error = e
+        return receipt_id, pdf_error
+
+    def on_receipt_saved(self, receipt, result, error):
+        if error is not None:
+            self.task_status_var.set("")
+            if messagebox.askyesno(
+                "Error",
+                f"Could not save receipt for {receipt['client_name'] or 'the client'}: {error}\n\n"
+                "Put it back in the form to try again? This replaces what the form holds now."
+            ):
+                self.fill_form(receipt)
+            return
+        receipt_id, pdf_error = result
+        self.last_saved_message = f"Receipt #{receipt_id} saved"
+        self.update_task_status()
+        if pdf_error is not None:
+            messagebox.showerror(
+                "Error", f"Receipt #{receipt_id} was saved, but its PDF could not be written: {pdf_error}\n\n"
+                "It can be printed again from the History."
+            )
+
+    def fill_form(self, receipt):
+        # The form as it was when the receipt was submitted
+        self.on_show()
+        self.client_name.insert(0, receipt['client_name'])
+        self.client_phone.insert(0, receipt['client_phone'])
+        for eye, entries in (('right_eye', (self.right_sph, self.right_cyl, self.right_axe)),
+                             ('left_eye', (self.left_sph, self.left_cyl, self.left_axe))):
+            for field, entry in zip(('sph', 'cyl', 'axe'), entries):
+                entry.insert(0, receipt[eye][field])
+        for item in receipt['items']:
+            self.add_item_to_receipt(item['product'], item['price'], item['quantity'])
+        self.discount_var.set(str(receipt['discount']) if receipt['discount'] else "")
+        self.num_discount_var.set(str(receipt['numerical_discount']) if receipt['numerical_discount'] else "")
+        self.advance_var.set(str(receipt['advance_payment']))
+
+    def update_task_status(self):
+        pending = self.controller.tasks.pending()
+        if pending:
+            self.task_status_var.set(f"Saving {pending} receipt(s)...")
+        else:
+            self.task_status_var.set(self.last_saved_message)
+
+    def poll_tasks(self):
+        if self._polling:
+            return
+        self._polling = True
+
+        def poll():
+            self.controller.tasks.poll()
+            self.update_task_status()
+            if self.controller.tasks.pending():
+                self.after(100, poll)
+            else:
+                self._polling = False
+
+        self.after(100, poll)
+
     def on_show(self):
         # Reset form when navigating to this frame
         self.receipt_items = []
+        self.pricing = ReceiptPricing()
         self.tree.delete(*self.tree.get_children())
         self.client_name.delete(0, tk.END)
         self.client_phone.delete(0, tk.END)
+        for entry in (self.right_sph, self.right_cyl, self.right_axe,
+                      self.left_sph, self.left_cyl, self.left_axe):
+            entry.delete(0, tk.END)
         self.discount_var.set("")
         self.advance_var.set("0")
         self.total_var.set("Total: $0.00")
         self.balance_var.set("Balance Due: $0.00")
         
-        # Refresh product list
-        products = [p['name'] for p in self.data_manager.get_products()]
-        self.product_cb.configure(values=products)
         self.num_discount_var.set("")
+        # Refresh product list
+        self.product_var.set("")
+        self.update_product_suggestions()
+
+    def update_product_suggestions(self):
+        # The dropdown only ever holds the first SUGGESTION_LIMIT matches for
+        # what has been typed, however large the catalog is
+        catalog = self.data_manager.get_catalog()
+        self.product_cb.configure(values=catalog.suggest(self.product_var.get(), self.SUGGESTION_LIMIT))
 
 class ReceiptHistory(ctk.CTkFrame):
+    # Only a window of WINDOW_PAGES pages is kept in the Treeview; pages are
+    # fetched newest first as the user scrolls towards either edge
+    PAGE_SIZE = 100
+    WINDOW_PAGES = 3
+
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
-        self.data_manager = DataManager()
+        self.data_manager = get_data_manager()
+        self.window_start = 0
+        self.total_receipts = 0
+        self._paging = False
+        self._search_job = None
+        
+        # Client search (name or phone)
+        search_frame = ctk.CTkFrame(self)
+        search_frame.pack(fill="x", padx=20, pady=(10, 0))
+        ctk.CTkLabel(search_frame, text="Search client:").pack(side="left", padx=5)
+        self.search_var = ctk.StringVar()
+        ctk.CTkEntry(search_frame, textvariable=self.search_var, width=250).pack(side="left", padx=5)
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
         
         # Create widgets
-        self.tree = ttk.Treeview(self, columns=('Date', 'Client', 'Total'), show='headings')
+        self.tree = ttk.Treeview(self, columns=('Date', 'Client', 'Total', 'Discounts'), show='headings')
         self.tree.heading('Date', text='Date')
         self.tree.heading('Client', text='Client')
         self.tree.heading('Total', text='Total')
+        self.tree.heading('Discounts', text='Discounts Applied')
         
         # Add scrollbar
-        scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
+        
+        self.status_var = ctk.StringVar()
         
         btn_frame = ctk.CTkFrame(self)
         ctk.CTkButton(btn_frame, text="View Details", command=self.view_details).pack(side="left", padx=5)
         ctk.CTkButton(btn_frame, text="Delete", command=self.delete_receipt).pack(side="left", padx=5)
         ctk.CTkButton(btn_frame, text="Save as PDF", command=self.save_as_pdf).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Export Selected", command=self.export_selected).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Z-Report", command=self.save_z_report).pack(side="left", padx=5)
 
         
         # Layout
-        scrollbar.pack(side="right", fill="y")
+        self.scrollbar.pack(side="right", fill="y")
         self.tree.pack(fill="both", expand=True, padx=20, pady=10)
+        ctk.CTkLabel(self, textvariable=self.status_var).pack()
         btn_frame.pack(pady=10)
         
         # Bind double-click event
         self.tree.bind('<Double-1>', lambda e: self.view_details())
         
-        self.load_receipts()
-        
     def save_as_pdf(self):
         selected = self.tree.selection()
         if not selected:
             messagebox.showerror("Error", "No receipt selected")
             return
-        total_items = len(self.data_manager.get_receipts())
-        selected_index = total_items - self.tree.index(selected[0]) - 1
-        receipt = self.data_manager.get_receipts()[selected_index]
+        receipt = self.data_manager.get_receipt(int(selected[0]))
         
         file_path = filedialog.asksaveasfilename(
             defaultextension=".pdf",
             filetypes=[("PDF Files", "*.pdf")]
         )
         if file_path:
-            generate_pdf_from_receipt(receipt, file_path)
+            save_receipt_pdf(receipt, file_path, self.data_manager.pdf_cache)
             messagebox.showinfo("Success", "PDF saved successfully")
 
+    def save_z_report(self):
+        # Today's receipts and totals
+        day = datetime.now().strftime("%Y-%m-%d")
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            initialfile=f"z_report_{day}.pdf",
+            filetypes=[("PDF Files", "*.pdf")]
+        )
+        if file_path:
+            generate_z_report(day, self.data_manager.get_receipts_between(day, day), file_path)
+            messagebox.showinfo("Success", "Z-report saved successfully")
+
+    def export_selected(self):
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showerror("Error", "No receipt selected")
+            return
+        out_dir = filedialog.askdirectory(title="Export PDFs to")
+        if not out_dir:
+            return
+        receipts = [self.data_manager.get_receipt(int(iid)) for iid in selected]
+        self._export_progress = (0, len(receipts), 0.0)
+        self._export_result = None
+
+        # Render in the background and poll for progress from the Tk thread
+        def run():
+            try:
+                self._export_result = export_receipts(
+                    receipts, out_dir, cache=self.data_manager.pdf_cache,
+                    progress=lambda *progress: setattr(self, '_export_progress', progress)
+                )
+            except Exception as e:
+                self._export_result = e
+
+        threading.Thread(target=run, daemon=True).start()
+        self.poll_export(out_dir)
+
+    def poll_export(self, out_dir):
+        done, total, rate = self._export_progress
+        self.status_var.set(f"Exporting PDFs: {done}/{total} ({rate:.1f} receipts/s)")
+        result = self._export_result
+        if result is None:
+            self.after(200, self.poll_export, out_dir)
+            return
+        self.update_status()
+        if isinstance(result, Exception):
+            messagebox.showerror("Error", f"PDF export failed: {result}")
+        else:
+            messagebox.showinfo(
+                "Success",
+                f"Exported {result['count']} receipts to {out_dir} ({result['rate']:.1f} receipts/s, "
+                f"{result['cached']} from the cache)"
+            )
+
     def on_show(self):
-        self.load_receipts()
+        if self.search_var.get().strip():
+            self.run_search()
+        else:
+            self.load_receipts()
 
+    @timed("ui.load_receipts")
     def load_receipts(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        receipts = self.data_manager.get_receipts()
-        # Insert receipts in reverse order (newest first)
-        for receipt in reversed(receipts):
-            self.tree.insert('', 0, values=(
-                receipt['date'],
-                receipt['client_name'],
-                f"${receipt['total']:.2f}",
-                f"-{receipt['discount']}%/-${receipt['numerical_discount']:.2f}"
-            ))
-        # Update tree columns
-        self.tree.configure(columns=('Date', 'Client', 'Total', 'Discounts'))
-        self.tree.heading('Discounts', text='Discounts Applied')
+        self.tree.delete(*self.tree.get_children())
+        self.window_start = 0
+        self.total_receipts = self.data_manager.count_receipts()
+        # Newest first, keyed by receipt id
+        for receipt in self.data_manager.get_header_page(0, self.PAGE_SIZE * 2):
+            self.tree.insert('', tk.END, iid=str(receipt['id']), values=self.row_values(receipt))
+        self.update_status()
+
+    def schedule_search(self):
+        # Wait for a pause in typing before querying
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(150, self.run_search)
+
+    def run_search(self):
+        self._search_job = None
+        query = self.search_var.get().strip()
+        if not query:
+            self.load_receipts()
+            return
+        self.tree.delete(*self.tree.get_children())
+        headers = self.data_manager.search_receipts(query, limit=self.PAGE_SIZE * self.WINDOW_PAGES)
+        for header in headers:
+            self.tree.insert('', tk.END, iid=str(header['id']), values=self.row_values(header))
+        self.status_var.set(f"{len(headers)} matching receipts" if headers else "No matching receipts")
+
+    def row_values(self, receipt):
+        return (
+            receipt['date'],
+            receipt['client_name'],
+            format_money(receipt['total']),
+            f"-{receipt['discount']}%/-${receipt.get('numerical_discount', 0):.2f}"
+        )
+
+    def update_row(self, receipt):
+        if self.tree.exists(str(receipt['id'])):
+            self.tree.item(str(receipt['id']), values=self.row_values(receipt))
+
+    def update_status(self):
+        shown = len(self.tree.get_children())
+        if shown:
+            self.status_var.set(f"Showing {self.window_start + 1}-{self.window_start + shown} of {self.total_receipts} receipts")
+        else:
+            self.status_var.set("No receipts")
+
+    def on_tree_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._paging or self.search_var.get().strip():
+            return
+        window_end = self.window_start + len(self.tree.get_children())
+        if float(last) > 0.95 and window_end < self.total_receipts:
+            self._paging = True
+            self.after_idle(self.load_next_page)
+        elif float(first) < 0.05 and self.window_start > 0:
+            self._paging = True
+            self.after_idle(self.load_previous_page)
 
+    def load_next_page(self):
+        rows = self.tree.get_children()
+        start = self.window_start + len(rows)
+        for receipt in self.data_manager.get_header_page(start, self.PAGE_SIZE):
+            self.tree.insert('', tk.END, iid=str(receipt['id']), values=self.row_values(receipt))
+        # Drop the oldest page from the top once the window is full
+        excess = len(rows) + self.PAGE_SIZE - self.PAGE_SIZE * self.WINDOW_PAGES
+        if excess > 0:
+            self.tree.delete(*rows[:excess])
+            self.window_start += excess
+        if rows:
+            self.tree.see(rows[-1])
+        self.update_status()
+        self._paging = False
+
+    def load_previous_page(self):
+        rows = self.tree.get_children()
+        start = max(self.window_start - self.PAGE_SIZE, 0)
+        page = self.data_manager.get_header_page(start, self.window_start - start)
+        for position, receipt in enumerate(page):
+            self.tree.insert('', position, iid=str(receipt['id']), values=self.row_values(receipt))
+        self.window_start = start
+        # Drop rows past the window at the bottom
+        excess = len(rows) + len(page) - self.PAGE_SIZE * self.WINDOW_PAGES
+        if excess > 0:
+            self.tree.delete(*rows[-excess:])
+        if rows:
+            self.tree.see(rows[0])
+        self.update_status()
+        self._paging = False
 
     def delete_receipt(self):
         selected = self.tree.selection()
@@ -793,31 +1129,136 @@ class ReceiptHistory(ctk.CTkFrame):
             return
         
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this receipt?"):
-            # Get the total number of items and subtract the selected index from it
-            total_items = len(self.data_manager.get_receipts())
-            selected_index = total_items - self.tree.index(selected[0]) - 1  # Reverse the index
-            
-            self.data_manager.delete_receipt(selected_index)
-            self.load_receipts()
+            self.data_manager.delete_receipt(int(selected[0]))
+            self.tree.delete(selected[0])
+            self.total_receipts -= 1
+            self.update_status()
 
     def view_details(self):
         selected = self.tree.selection()
         if not selected:
             return
             
-        # Get the total number of items and subtract the selected index from it
-        total_items = len(self.data_manager.get_receipts())
-        selected_index = total_items - self.tree.index(selected[0]) - 1  # Reverse the index
+        receipt_id = int(selected[0])
+        receipt = self.data_manager.get_receipt(receipt_id)
+        ReceiptDetails(self, receipt, receipt_id)
+
+class OutstandingBalances(ctk.CTkFrame):
+    # Clients who still owe money, from the ledger the DataManager keeps
+    # current, and the receipts behind the selected client's balance
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        self.data_manager = get_data_manager()
+        self.clients = []
+        self.sort_column = 'outstanding'
+        self.sort_reverse = True
+        
+        columns = (('name', 'Client'), ('phone', 'Phone'), ('receipts', 'Receipts'), ('outstanding', 'Outstanding'))
+        self.client_tree = ttk.Treeview(self, columns=[c for c, _ in columns], show='headings', height=12)
+        for column, text in columns:
+            self.client_tree.heading(column, text=text, command=lambda c=column: self.sort_by(c))
+        self.client_tree.bind('<<TreeviewSelect>>', lambda e: self.load_client_receipts())
+        
+        self.receipt_tree = ttk.Treeview(self, columns=('Date', 'Total', 'Paid', 'Balance'), show='headings', height=6)
+        for column in ('Date', 'Total', 'Paid', 'Balance'):
+            self.receipt_tree.heading(column, text=column)
+        
+        self.status_var = ctk.StringVar()
+        btn_frame = ctk.CTkFrame(self)
+        ctk.CTkButton(btn_frame, text="Record Payment", command=self.record_payment).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Statement PDF", command=self.save_statement).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Refresh", command=self.on_show).pack(side="left", padx=5)
         
-        receipt = self.data_manager.get_receipts()[selected_index]
-        ReceiptDetails(self, receipt, selected_index)
+        # Layout
+        self.client_tree.pack(fill="both", expand=True, padx=20, pady=10)
+        self.receipt_tree.pack(fill="x", padx=20)
+        ctk.CTkLabel(self, textvariable=self.status_var).pack()
+        btn_frame.pack(pady=10)
+
+    def on_show(self):
+        self.clients = self.data_manager.get_outstanding_clients()
+        total = sum(client['outstanding'] for client in self.clients)
+        self.status_var.set(f"{len(self.clients)} clients owe {format_money(total)}")
+        self.load_clients()
+
+    def sort_by(self, column):
+        # Clicking the same heading again flips the order
+        if column == self.sort_column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = column in ('receipts', 'outstanding')
+        self.load_clients()
+
+    def load_clients(self):
+        selected = self.client_tree.selection()
+        key = self.sort_column
+        self.clients.sort(key=lambda c: c[key].lower() if isinstance(c[key], str) else c[key],
+                          reverse=self.sort_reverse)
+        self.client_tree.delete(*self.client_tree.get_children())
+        for client in self.clients:
+            self.client_tree.insert('', tk.END, iid=client['key'], values=(
+                client['name'], client['phone'], client['receipts'], format_money(client['outstanding'])
+            ))
+        if selected and self.client_tree.exists(selected[0]):
+            self.client_tree.selection_set(selected[0])
+            self.client_tree.see(selected[0])
+            self.load_client_receipts()
+        else:
+            self.receipt_tree.delete(*self.receipt_tree.get_children())
+
+    def load_client_receipts(self):
+        self.receipt_tree.delete(*self.receipt_tree.get_children())
+        selected = self.client_tree.selection()
+        if not selected:
+            return
+        for header in self.data_manager.get_client_receipts(selected[0]):
+            paid = header['total'] - header['balance_due']
+            self.receipt_tree.insert('', tk.END, iid=str(header['id']), values=(
+                header['date'], format_money(header['total']), format_money(paid),
+                format_money(header['balance_due'])
+            ))
+
+    def save_statement(self):
+        selected = self.client_tree.selection()
+        if not selected:
+            messagebox.showerror("Error", "No client selected")
+            return
+        client = self.data_manager.get_client(selected[0])
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            filetypes=[("PDF Files", "*.pdf")]
+        )
+        if file_path:
+            generate_statement(client, self.data_manager.iter_client_receipts(selected[0]), file_path)
+            messagebox.showinfo("Success", "Statement saved successfully")
+
+    def record_payment(self):
+        selected = self.receipt_tree.selection()
+        if not selected:
+            messagebox.showerror("Error", "Select one of the client's receipts")
+            return
+        receipt_id = int(selected[0])
+        balance = self.receipt_tree.item(selected[0], 'values')[3]
+        amount = ctk.CTkInputDialog(title="Record Payment", text=f"Amount paid (balance {balance}):").get_input()
+        if not amount:
+            return
+        try:
+            self.data_manager.record_payment(receipt_id, amount)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.on_show()
+        if self.receipt_tree.exists(selected[0]):
+            self.receipt_tree.selection_set(selected[0])
 
 class ReceiptDetails(ctk.CTkToplevel):
-    def __init__(self, parent, receipt, receipt_index):
+    def __init__(self, parent, receipt, receipt_id):
         super().__init__(parent)
         self.parent = parent
         self.receipt = receipt
-        self.receipt_index = receipt_index
+        self.receipt_id = receipt_id
         self.title("Receipt Details")
         self.geometry("600x500")
         
@@ -943,14 +1384,10 @@ class ReceiptDetails(ctk.CTkToplevel):
             # Update items
             self.receipt['items'] = []
             for name_entry, qty_entry, price_entry in self.item_entries:
-                qty = int(qty_entry.get())
-                price = float(price_entry.get())
-                total = qty * price
                 self.receipt['items'].append({
                     'product': name_entry.get(),
-                    'quantity': qty,
-                    'price': price,
-                    'total': total
+                    'quantity': int(qty_entry.get()),
+                    'price': float(price_entry.get())
                 })
             
             # Update payment information
@@ -960,75 +1397,58 @@ class ReceiptDetails(ctk.CTkToplevel):
 
             
             # Recalculate totals
-            subtotal = sum(item['total'] for item in self.receipt['items'])
-            total_after_percent = subtotal * (1 - self.receipt['discount']/100)
-            self.receipt['total'] = max(total_after_percent - self.receipt['numerical_discount'], 0)
-            self.receipt['balance_due'] = self.receipt['total'] - self.receipt['advance_payment']
+            price_receipt(self.receipt)
             
             # Save changes
-            self.parent.data_manager.update_receipt(self.receipt_index, self.receipt)
-            self.parent.load_receipts()
+            self.parent.data_manager.update_receipt(self.receipt_id, self.receipt)
+            self.parent.update_row(self.receipt)
             
             messagebox.showinfo("Success", "Changes saved successfully")
             self.destroy()
             
         except ValueError as e:
             messagebox.showerror("Error", "Invalid number format in one or more fields")
-def generate_pdf_from_receipt(receipt, file_path):
-    pdf = canvas.Canvas(file_path, pagesize=A4)
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(100, 800, "Lens Optic Receipt")
-    
-    pdf.setFont("Helvetica", 12)
-    y = 750
-    pdf.drawString(100, y, f"Date: {receipt['date']}")
-    pdf.drawString(300, y, f"Client: {receipt['client_name']}")
-    y -= 20
-    pdf.drawString(100, y, f"Phone: {receipt['client_phone']}")
-    y -= 30
-    
-    # Prescription Information
-    pdf.drawString(100, y, "Prescription:")
-    y -= 20
-    pdf.drawString(120, y, "Right Eye:")
-    pdf.drawString(220, y, f"SPH: {receipt['right_eye']['sph']}  CYL: {receipt['right_eye']['cyl']}  AXE: {receipt['right_eye']['axe']}")
-    y -= 20
-    pdf.drawString(120, y, "Left Eye:")
-    pdf.drawString(220, y, f"SPH: {receipt['left_eye']['sph']}  CYL: {receipt['left_eye']['cyl']}  AXE: {receipt['left_eye']['axe']}")
-    y -= 30
-    
-    # Items
-    pdf.drawString(100, y, "Items:")
-    y -= 20
-    for item in receipt['items']:
-        pdf.drawString(120, y, f"{item['product']} x{item['quantity']} @ ${item['price']:.2f}")
-        pdf.drawString(400, y, f"${item['total']:.2f}")
-        y -= 20
-    
-    # Payment Information
-    y -= 20
-    pdf.setFont("Helvetica-Bold", 12)
-    pdf.drawString(100, y, f"Subtotal: ${receipt['subtotal']:.2f}")
-    y -= 20
-    pdf.drawString(100, y, f"Percentage Discount: {receipt['discount']}%")
-    y -= 20
-    pdf.drawString(100, y, f"Fixed Discount: ${receipt['numerical_discount']:.2f}")
-    y -= 20
-    pdf.drawString(100, y, f"Total: ${receipt['total']:.2f}")
-    y -= 20
-    pdf.drawString(100, y, f"Advance Payment: ${receipt['advance_payment']:.2f}")
-    y -= 20
-    pdf.drawString(100, y, f"Balance Due: ${receipt['balance_due']:.2f}")
-
-    # Footer
-    y -= 40
-    pdf.setFont("Helvetica", 10)
-    if receipt['balance_due'] > 0:
-        pdf.drawString(100, y, "Note: Balance payment is due upon delivery of the product.")
-    else:
-        pdf.drawString(100, y, "Note: Full payment has been received. Thank you for your business!")
-    
-    pdf.save()
+class DiagnosticsPanel(ctk.CTkToplevel):
+    # Live span latencies and counters from instrumentation, refreshed
+    # every second while open
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Diagnostics")
+        self.geometry("760x420")
+        
+        columns = ('Span', 'Count', 'p50 ms', 'p95 ms', 'p99 ms', 'Max ms')
+        self.tree = ttk.Treeview(self, columns=columns, show='headings')
+        for column in columns:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=260 if column == 'Span' else 80, anchor="w" if column == 'Span' else "e")
+        self.status_var = ctk.StringVar()
+        
+        self.tree.pack(fill="both", expand=True, padx=10, pady=10)
+        ctk.CTkLabel(self, textvariable=self.status_var, wraplength=700).pack(padx=10)
+        if instrumentation.ENABLED:
+            ctk.CTkButton(self, text="Export Now", command=self.export).pack(pady=10)
+        self.refresh()
+
+    def refresh(self):
+        if not instrumentation.ENABLED:
+            self.status_var.set("Instrumentation is off. Start the app with OPTICAL_METRICS=1 to collect timings.")
+            return
+        snapshot = instrumentation.metrics.snapshot()
+        self.tree.delete(*self.tree.get_children())
+        for name, stats in snapshot['spans'].items():
+            self.tree.insert('', tk.END, values=(
+                name, stats['count'],
+                *(f"{stats[key] * 1000:.2f}" for key in ('p50', 'p95', 'p99', 'max'))
+            ))
+        counters = ", ".join(f"{name}: {value}" for name, value in snapshot['counters'].items())
+        self.status_var.set(f"Exported to {instrumentation.METRICS_FILE}. {counters}")
+        self.after(1000, self.refresh)
+
+    def export(self):
+        instrumentation.metrics.export(instrumentation.METRICS_FILE)
+
+
 if __name__ == "__main__":
+    instrumentation.start()
     app = MainApplication() 
     app.mainloop()  
@@ -0,0 +1,340 @@
+import base64
+import bisect
+import copy
+import gzip
+import json
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+from serializers import MAGIC, dumps, loads
+from storage import file_signature, read_migration_source, receipt_header, write_atomic
+
+
+def _pack_ids(ids):
+    return base64.b64encode(array('q', ids).tobytes()).decode('ascii')
+
+
+def _unpack_ids(text):
+    ids = array('q')
+    ids.frombytes(base64.b64decode(text))
+    return ids
+
+
+class PartitionedReceiptStore:
+    # Receipts partitioned by the month of their date, under data/receipts/.
+    #
+    # Every change is appended to hot.jsonl, a put/del journal like the one
+    # JournalReceiptStore keeps. On roll(), receipts of months that have
+    # ended are folded out of it into read-only gzip segments
+    # (YYYY-MM.<generation>.jsonl.gz, one receipt per line, or the month as
+    # one list in the configured binary format), so the hot
+    # journal only holds the current month plus any later edits to older
+    # receipts. manifest.json lists each segment with the ids it holds: ids
+    # are known without opening a segment, and a segment is decompressed
+    # only when one of its receipts is read. Next to each segment,
+    # YYYY-MM.<generation>.headers.jsonl holds its receipt headers, so the
+    # history grid and client lists never decompress bodies.
+    CACHED_SEGMENTS = 4
+    CACHED_HEADER_SEGMENTS = 24
+
+    def __init__(self, path, journal_file=None, legacy_file=None, file_format='json'):
+        self.path = path
+        self.file_format = file_format
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.hot_path = os.path.join(path, "hot.jsonl")
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()
+        self._header_cache = OrderedDict()
+        if not os.path.exists(self.manifest_path):
+            self._create(journal_file, legacy_file)
+            self._load()
+            self.roll()
+        else:
+            self._load()
+
+    def _create(self, journal_file, legacy_file):
+        # First start: carry over the journal (or the older single file),
+        # ids included; roll() then moves past months into segments
+        receipts, next_id = read_migration_source(journal_file, legacy_file)
+        os.makedirs(self.path, exist_ok=True)
+        write_atomic(self.hot_path, b''.join(
+            self._encode({'op': 'put', 'id': r['id'], 'receipt': r}) for r in receipts
+        ))
+        self._write_manifest({'generation': 0, 'next_id': next_id, 'segments': {}})
+
+    def _encode(self, entry):
+        return (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+
+    def _encode_segment(self, receipts):
+        if self.file_format == 'json':
+            return b''.join(self._encode(receipt) for receipt in receipts)
+        return dumps(receipts, self.file_format)
+
+    def _write_manifest(self, manifest):
+        write_atomic(self.manifest_path, json.dumps(manifest).encode('utf-8'))
+
+    def signature(self):
+        return file_signature(self.manifest_path), file_signature(self.hot_path)
+
+    def _load(self):
+        with open(self.manifest_path, 'r') as f:
+            self._manifest = json.load(f)
+        self._next_id = self._manifest['next_id']
+        # id -> month of the segment holding it
+        self._archived = {}
+        for month, segment in self._manifest['segments'].items():
+            self._archived.update(dict.fromkeys(_unpack_ids(segment['ids']), month))
+        self._hot = {}
+        self._tombstones = set()
+        offset = 0
+        with open(self.hot_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Torn write from a crash: drop the partial record
+                    break
+                self._apply(json.loads(line))
+                offset += len(line)
+        if offset != os.path.getsize(self.hot_path):
+            os.truncate(self.hot_path, offset)
+        live = set(self._archived)
+        live.difference_update(self._tombstones)
+        live.update(self._hot)
+        self._order = sorted(live)
+        self._seen = self.signature()
+
+    def _apply(self, entry):
+        receipt_id = entry['id']
+        self._next_id = max(self._next_id, receipt_id + 1)
+        if entry['op'] == 'put':
+            entry['receipt']['id'] = receipt_id
+            self._hot[receipt_id] = entry['receipt']
+            self._tombstones.discard(receipt_id)
+        else:
+            self._hot.pop(receipt_id, None)
+            if receipt_id in self._archived:
+                self._tombstones.add(receipt_id)
+
+    def _refresh(self):
+        # Another process wrote to the store: start over from the files
+        if self.signature() != self._seen:
+            self._cache.clear()
+            self._header_cache.clear()
+            self._load()
+
+    def _headers_path(self, segment_file):
+        return os.path.join(self.path, segment_file[:-len(".jsonl.gz")] + ".headers.jsonl")
+
+    def _segment(self, month):
+        # Receipts of one archived month, decompressed on first use and kept
+        # for the CACHED_SEGMENTS most recently used months
+        if month in self._cache:
+            self._cache.move_to_end(month)
+            return self._cache[month]
+        path = os.path.join(self.path, self._manifest['segments'][month]['file'])
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+        # JSON segments are one receipt per line; other formats hold the
+        # month as a single serialized list
+        if data.startswith(MAGIC):
+            receipts = {receipt['id']: receipt for receipt in loads(data)}
+        else:
+            receipts = {receipt['id']: receipt for receipt in map(json.loads, data.splitlines())}
+        self._cache[month] = receipts
+        while len(self._cache) > self.CACHED_SEGMENTS:
+            self._cache.popitem(last=False)
+        return receipts
+
+    def _header_segment(self, month):
+        # Headers of one archived month, read from the segment's sidecar
+        headers = self._header_cache.get(month)
+        if headers is not None:
+            self._header_cache.move_to_end(month)
+            return headers
+        try:
+            with open(self._headers_path(self._manifest['segments'][month]['file']), 'rb') as f:
+                headers = {header['id']: header for header in map(json.loads, f.read().splitlines())}
+        except FileNotFoundError:
+            # Segment written before sidecars; the next roll() adds one
+            headers = {receipt_id: receipt_header(receipt) for receipt_id, receipt in self._segment(month).items()}
+        self._header_cache[month] = headers
+        while len(self._header_cache) > self.CACHED_HEADER_SEGMENTS:
+            self._header_cache.popitem(last=False)
+        return headers
+
+    def _exists(self, receipt_id):
+        return receipt_id in self._hot or (receipt_id in self._archived and receipt_id not in self._tombstones)
+
+    def _get(self, receipt_id):
+        if receipt_id in self._hot:
+            receipt = self._hot[receipt_id]
+        elif self._exists(receipt_id):
+            receipt = self._segment(self._archived[receipt_id])[receipt_id]
+        else:
+            raise KeyError(receipt_id)
+        # Callers own what they get back; the in-memory copies stay intact
+        return copy.deepcopy(receipt)
+
+    def _header(self, receipt_id):
+        if receipt_id in self._hot:
+            return receipt_header(self._hot[receipt_id])
+        if self._exists(receipt_id):
+            return dict(self._header_segment(self._archived[receipt_id])[receipt_id])
+        raise KeyError(receipt_id)
+
+    def _append(self, entry):
+        with open(self.hot_path, 'ab') as f:
+            f.write(self._encode(entry))
+        self._apply(entry)
+        self._seen = self.signature()
+
+    def get_all(self):
+        with self._lock:
+            self._refresh()
+            return [self._get(receipt_id) for receipt_id in self._order]
+
+    def get(self, receipt_id):
+        with self._lock:
+            self._refresh()
+            return self._get(receipt_id)
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._order)
+
+    def _page_ids(self, start, limit):
+        end = len(self._order) - start
+        return self._order[max(end - limit, 0):max(end, 0)][::-1]
+
+    def page(self, start, limit):
+        # Newest first; only the segments these receipts live in are opened
+        with self._lock:
+            self._refresh()
+            return [self._get(receipt_id) for receipt_id in self._page_ids(start, limit)]
+
+    def header_page(self, start, limit):
+        with self._lock:
+            self._refresh()
+            return [self._header(receipt_id) for receipt_id in self._page_ids(start, limit)]
+
+    def header(self, receipt_id):
+        with self._lock:
+            self._refresh()
+            return self._header(receipt_id)
+
+    def headers(self, receipt_ids):
+        with self._lock:
+            self._refresh()
+            return [self._header(i) for i in receipt_ids if self._exists(i)]
+
+    def receipts_between(self, since=None, until=None):
+        # Receipts dated within [since, until] (YYYY-MM-DD, either may be
+        # None), in id order. Segments of months outside the range are
+        # skipped without being opened.
+        with self._lock:
+            self._refresh()
+            found = {}
+            for month in self._manifest['segments']:
+                if (since and month < since[:7]) or (until and month > until[:7]):
+                    continue
+                for receipt_id, receipt in self._segment(month).items():
+                    if receipt_id not in self._hot and receipt_id not in self._tombstones:
+                        found[receipt_id] = receipt
+            found.update(self._hot)
+            return [
+                copy.deepcopy(found[receipt_id]) for receipt_id in sorted(found)
+                if (not since or found[receipt_id]['date'][:10] >= since)
+                and (not until or found[receipt_id]['date'][:10] <= until)
+            ]
+
+    def append(self, receipt):
+        with self._lock:
+            self._refresh()
+            receipt['id'] = self._next_id
+            self._append({'op': 'put', 'id': receipt['id'], 'receipt': copy.deepcopy(receipt)})
+            self._order.append(receipt['id'])
+            return receipt['id']
+
+    def update(self, receipt_id, receipt):
+        # Edits to archived receipts also land in the hot journal; the
+        # segment copy is shadowed until the next roll rewrites it
+        with self._lock:
+            self._refresh()
+            if not self._exists(receipt_id):
+                raise KeyError(receipt_id)
+            receipt['id'] = receipt_id
+            self._append({'op': 'put', 'id': receipt_id, 'receipt': copy.deepcopy(receipt)})
+
+    def delete(self, receipt_id):
+        with self._lock:
+            self._refresh()
+            if not self._exists(receipt_id):
+                raise KeyError(receipt_id)
+            self._append({'op': 'del', 'id': receipt_id})
+            del self._order[bisect.bisect_left(self._order, receipt_id)]
+
+    def _write_headers(self, segment_file, receipts):
+        # Always JSON lines, like the journal's headers file
+        write_atomic(self._headers_path(segment_file), b''.join(
+            self._encode(receipt_header(receipts[i])) for i in sorted(receipts)
+        ))
+
+    def roll(self):
+        # Folds hot receipts of past months, edits to archived receipts and
+        # deletions into new segment files. Receipts read the same before and
+        # after, but the signature changes; DataManager.flush() calls this
+        # and records the new signature with its derived indexes, so they
+        # stay current. The manifest replacement is the
+        # commit point: a crash before it leaves the old segments in use,
+        # and a crash after it only leaves hot records that fold in again
+        # to the same result.
+        with self._lock:
+            current = datetime.now().strftime("%Y-%m")
+            closing = {}
+            for receipt_id, receipt in self._hot.items():
+                if receipt['date'][:7] < current:
+                    closing.setdefault(receipt['date'][:7], {})[receipt_id] = receipt
+            touched = set(closing)
+            touched.update(self._archived[i] for i in self._tombstones)
+            touched.update(self._archived[i] for i in self._hot if i in self._archived)
+            # Sidecars for segments written before they existed
+            for month, segment in self._manifest['segments'].items():
+                if month not in touched and not os.path.exists(self._headers_path(segment['file'])):
+                    self._write_headers(segment['file'], self._segment(month))
+            if not touched:
+                return
+            generation = self._manifest['generation'] + 1
+            segments = dict(self._manifest['segments'])
+            for month in sorted(touched):
+                receipts = dict(self._segment(month)) if month in segments else {}
+                for receipt_id in list(receipts):
+                    if receipt_id in self._hot or receipt_id in self._tombstones:
+                        del receipts[receipt_id]
+                receipts.update(closing.get(month, {}))
+                if not receipts:
+                    segments.pop(month, None)
+                    continue
+                name = f"{month}.{generation}.jsonl.gz"
+                write_atomic(os.path.join(self.path, name), gzip.compress(self._encode_segment(
+                    [receipts[i] for i in sorted(receipts)]
+                )))
+                self._write_headers(name, receipts)
+                segments[month] = {'file': name, 'count': len(receipts), 'ids': _pack_ids(sorted(receipts))}
+            self._write_manifest({'generation': generation, 'next_id': self._next_id, 'segments': segments})
+            write_atomic(self.hot_path, b''.join(
+                self._encode({'op': 'put', 'id': receipt_id, 'receipt': receipt})
+                for receipt_id, receipt in self._hot.items() if receipt['date'][:7] >= current
+            ))
+            # Segment files the new manifest no longer refers to
+            keep = {segment['file'] for segment in segments.values()}
+            for name in os.listdir(self.path):
+                if name.endswith(".jsonl.gz") and name not in keep:
+                    os.remove(os.path.join(self.path, name))
+                elif name.endswith(".headers.jsonl") and name[:-len(".headers.jsonl")] + ".jsonl.gz" not in keep:
+                    os.remove(os.path.join(self.path, name))
+            self._cache.clear()
+            self._header_cache.clear()
+            self._load()
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+
+def content_key(receipt, version):
+    # SHA-256 of the receipt as canonical JSON (sorted keys, no whitespace)
+    # and the template version, so equal content always maps to one file
+    canonical = json.dumps(receipt, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(f"{version}\n{canonical}".encode('utf-8')).hexdigest()
+
+
+class PdfCache:
+    # Rendered receipt PDFs under data/pdf_cache/, one <content key>.pdf per
+    # receipt version. A reprint of unchanged content is a file copy; a
+    # changed receipt or a new template version gets a new key, so stale
+    # entries are never served, and DataManager discards the old entry when
+    # a receipt is updated or deleted.
+    #
+    # Entries are copied out rather than hard-linked: a link would share the
+    # inode with the user's file, and editing or overwriting that in place
+    # would change the cached copy. Recency is the entry's mtime, touched on
+    # every hit; past max_bytes the least recently used entries are removed.
+    MAX_BYTES = 200 * 1024 * 1024
+
+    def __init__(self, path, version, max_bytes=MAX_BYTES):
+        self.path = path
+        self.version = version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Bytes held, counted on the first store rather than on open
+        self._size = None
+
+    def _entry(self, receipt):
+        return os.path.join(self.path, content_key(receipt, self.version) + ".pdf")
+
+    def fetch(self, receipt, file_path):
+        # Copies the cached PDF of this content to file_path; False on a miss
+        entry = self._entry(receipt)
+        try:
+            shutil.copyfile(entry, file_path)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            # Evicted or discarded by another thread since the copy, which
+            # is complete either way
+            pass
+        self.hits += 1
+        return True
+
+    def store(self, receipt, file_path):
+        # Adds the PDF just rendered to file_path for this content
+        entry = self._entry(receipt)
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(file_path, tmp_path)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, entry)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def discard(self, receipt):
+        entry = self._entry(receipt)
+        try:
+            size = os.path.getsize(entry)
+            os.remove(entry)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    def _entries(self):
+        # (mtime, size, path) of every entry
+        if not os.path.isdir(self.path):
+            return []
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".pdf"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        # Down to 90% of max_bytes, so a full cache does not rescan the
+        # directory on every store
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._entries():
+                os.remove(path)
+            self._size = 0
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'oldest': time.strftime("%Y-%m-%d %H:%M", time.localtime(min(entries)[0])) if entries else None,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
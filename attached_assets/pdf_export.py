@@ -0,0 +1,239 @@
+import os
+import time
+from datetime import datetime
+
+from instrumentation import timed
+from pdf_layout import PageLayout
+from pricing import format_money, from_cents, to_cents
+
+# Part of the PDF cache key: bump it whenever generate_pdf_from_receipt
+# draws something differently, so cached receipts are rendered again
+TEMPLATE_VERSION = 1
+
+
+@timed("pdf.generate_pdf_from_receipt")
+def generate_pdf_from_receipt(receipt, file_path):
+    # Items flow onto further pages when they do not fit; the totals and the
+    # note are kept together
+    def header(layout):
+        layout.canvas.setFont("Helvetica-Bold", 16)
+        if layout.page == 1:
+            layout.canvas.drawString(100, 800, "Lens Optic Receipt")
+        else:
+            layout.canvas.drawString(100, 800, "Lens Optic Receipt (continued)")
+        layout.y = 750
+
+    layout = PageLayout(file_path, header)
+    layout.row([(100, f"Date: {receipt['date']}"), (300, f"Client: {receipt['client_name']}")])
+    layout.row([(100, f"Phone: {receipt['client_phone']}")], 30)
+
+    # Prescription Information
+    layout.row([(100, "Prescription:")])
+    for label, eye, height in (("Right Eye:", receipt['right_eye'], 20), ("Left Eye:", receipt['left_eye'], 30)):
+        layout.row([(120, label), (220, f"SPH: {eye['sph']}  CYL: {eye['cyl']}  AXE: {eye['axe']}")], height)
+
+    # Items
+    layout.table([(100, "Items:")], (
+        [(120, f"{item['product']} x{item['quantity']} @ {format_money(item['price'])}"),
+         (400, format_money(item['total']))]
+        for item in receipt['items']
+    ))
+
+    # Payment Information
+    lines = [
+        f"Subtotal: {format_money(receipt['subtotal'])}",
+        f"Percentage Discount: {receipt['discount']}%",
+        f"Fixed Discount: {format_money(receipt['numerical_discount'])}",
+        f"Total: {format_money(receipt['total'])}",
+        f"Advance Payment: {format_money(receipt['advance_payment'])}",
+    ]
+    lines += [f"Payment {payment['date'][:10]}: {format_money(payment['amount'])}"
+              for payment in receipt.get('payments', ())]
+    lines.append(f"Balance Due: {format_money(receipt['balance_due'])}")
+    layout.space(20)
+    layout.ensure(20 * len(lines) + 40)
+    layout.set_font("Helvetica-Bold", 12)
+    for line in lines[:-1]:
+        layout.row([(100, line)])
+    layout.row([(100, lines[-1])], 40)
+
+    # Footer
+    layout.set_font("Helvetica", 10)
+    if receipt['balance_due'] > 0:
+        layout.row([(100, "Note: Balance payment is due upon delivery of the product.")])
+    else:
+        layout.row([(100, "Note: Full payment has been received. Thank you for your business!")])
+
+    layout.save()
+
+
+@timed("pdf.save_receipt_pdf")
+def save_receipt_pdf(receipt, file_path, cache=None):
+    # generate_pdf_from_receipt through a pdf_cache.PdfCache: a receipt
+    # whose content was rendered before is copied from the cache. Returns
+    # True on a cache hit.
+    if cache is not None and cache.fetch(receipt, file_path):
+        return True
+    generate_pdf_from_receipt(receipt, file_path)
+    if cache is not None:
+        cache.store(receipt, file_path)
+    return False
+
+
+def _report_header(title, subtitle):
+    def header(layout):
+        layout.canvas.setFont("Helvetica-Bold", 16)
+        layout.canvas.drawString(50, 800, title if layout.page == 1 else f"{title} (continued)")
+        layout.canvas.setFont("Helvetica", 11)
+        layout.canvas.drawString(50, 780, subtitle)
+        layout.y = 750
+    return header
+
+
+@timed("pdf.generate_statement")
+def generate_statement(client, headers, file_path):
+    # Client statement: one row per receipt from `headers` (an iterable of
+    # receipt headers, oldest first, e.g. DataManager.iter_client_receipts),
+    # then the totals. Rows are drawn as they arrive, so a client with
+    # thousands of receipts is never held in memory at once.
+    printed = datetime.now().strftime("%Y-%m-%d %H:%M")
+    subtitle = f"{client['name']}  {client['phone']}  -  printed {printed}"
+    layout = PageLayout(file_path, _report_header("Lens Optic - Client Statement", subtitle),
+                        title=f"Statement {client['name']}")
+    totals = {'count': 0, 'total': 0, 'balance': 0}
+
+    def rows():
+        for header in headers:
+            total, balance = to_cents(header['total']), to_cents(header['balance_due'])
+            totals['count'] += 1
+            totals['total'] += total
+            totals['balance'] += balance
+            yield [(50, header['date'][:10]), (130, f"#{header['id']}"),
+                   (350, format_money(from_cents(total)), 'right'),
+                   (450, format_money(from_cents(total - balance)), 'right'),
+                   (545, format_money(from_cents(balance)), 'right')]
+
+    layout.set_font("Helvetica", 10)
+    bold = ("Helvetica-Bold", 10)
+    layout.table([(50, "Date"), (130, "Receipt"), (350, "Total", 'right'), (450, "Paid", 'right'),
+                  (545, "Balance", 'right')], rows(), height=16, font=bold)
+    layout.space(8)
+    layout.ensure(3 * 16)
+    layout.row([(50, f"{totals['count']} receipts"),
+                (350, format_money(from_cents(totals['total'])), 'right'),
+                (450, format_money(from_cents(totals['total'] - totals['balance'])), 'right'),
+                (545, format_money(from_cents(totals['balance'])), 'right')], 24, font=bold)
+    layout.row([(50, f"Balance due: {format_money(from_cents(totals['balance']))}")],
+               font=("Helvetica-Bold", 12))
+    layout.save()
+    return totals['count']
+
+
+@timed("pdf.generate_z_report")
+def generate_z_report(day, receipts, file_path):
+    # End-of-day report: every receipt of `day` from the iterable, then the
+    # day's counts and amounts, totalled while the rows are drawn
+    printed = datetime.now().strftime("%Y-%m-%d %H:%M")
+    layout = PageLayout(file_path, _report_header("Lens Optic - Z-Report", f"Day {day}  -  printed {printed}"),
+                        title=f"Z-Report {day}")
+    totals = dict.fromkeys(('count', 'subtotal', 'total', 'balance'), 0)
+
+    def rows():
+        for receipt in receipts:
+            total, balance = to_cents(receipt['total']), to_cents(receipt['balance_due'])
+            totals['count'] += 1
+            totals['subtotal'] += to_cents(receipt['subtotal'])
+            totals['total'] += total
+            totals['balance'] += balance
+            yield [(50, receipt['date'][11:16]), (95, f"#{receipt['id']}"),
+                   (150, layout.clip(receipt['client_name'], 190)),
+                   (405, format_money(from_cents(total)), 'right'),
+                   (475, format_money(from_cents(total - balance)), 'right'),
+                   (545, format_money(from_cents(balance)), 'right')]
+
+    layout.set_font("Helvetica", 10)
+    layout.table([(50, "Time"), (95, "Receipt"), (150, "Client"), (405, "Total", 'right'),
+                  (475, "Paid", 'right'), (545, "Balance", 'right')],
+                 rows(), height=16, font=("Helvetica-Bold", 10))
+    summary = [
+        ("Receipts", str(totals['count'])),
+        ("Subtotal", format_money(from_cents(totals['subtotal']))),
+        ("Discounts", format_money(from_cents(totals['subtotal'] - totals['total']))),
+        ("Total sales", format_money(from_cents(totals['total']))),
+        ("Collected", format_money(from_cents(totals['total'] - totals['balance']))),
+        ("Balance due", format_money(from_cents(totals['balance']))),
+    ]
+    layout.space(16)
+    layout.ensure(20 * len(summary))
+    layout.set_font("Helvetica-Bold", 12)
+    for label, value in summary:
+        layout.row([(300, label), (545, value, 'right')])
+    layout.save()
+    return totals
+
+
+def receipt_pdf_name(receipt):
+    # Deterministic, so re-exporting a batch overwrites rather than duplicates
+    return f"receipt_{receipt['id']:06d}_{receipt['date'][:10]}.pdf"
+
+
+def _render_job(job):
+    receipt, file_path = job
+    generate_pdf_from_receipt(receipt, file_path)
+    return receipt['id']
+
+
+@timed("pdf.export_receipts")
+def export_receipts(receipts, out_dir, workers=None, progress=None, cache=None):
+    # Renders every receipt into out_dir across a process pool. progress is
+    # called as progress(done, total, receipts_per_second) after each file.
+    # With a cache, receipts it holds are copied out first and only the
+    # others are sent to the pool; their PDFs are then added to it.
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(receipt, os.path.join(out_dir, receipt_pdf_name(receipt))) for receipt in receipts]
+    total = len(jobs)
+    started = time.perf_counter()
+    done = 0
+
+    def report():
+        elapsed = time.perf_counter() - started
+        if progress:
+            progress(done, total, done / elapsed if elapsed else 0.0)
+
+    if cache is not None:
+        misses = []
+        for job in jobs:
+            if cache.fetch(*job):
+                done += 1
+                report()
+            else:
+                misses.append(job)
+        jobs = misses
+    cached = done
+    rendered_jobs = {receipt['id']: (receipt, file_path) for receipt, file_path in jobs}
+
+    def rendered(receipt_id):
+        nonlocal done
+        if cache is not None:
+            cache.store(*rendered_jobs[receipt_id])
+        done += 1
+        report()
+
+    if workers == 1 or len(jobs) < 2:
+        # Not worth spinning up worker processes
+        for job in jobs:
+            rendered(_render_job(job))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, min(32, len(jobs) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for receipt_id in pool.map(_render_job, jobs, chunksize=chunksize):
+                rendered(receipt_id)
+    seconds = time.perf_counter() - started
+    return {
+        'count': done,
+        'cached': cached,
+        'seconds': seconds,
+        'rate': done / seconds if seconds else 0.0,
+    }
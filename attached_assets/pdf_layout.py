@@ -0,0 +1,103 @@
+LINE = 20
+
+
+class PageLayout:
+    # Flowing layout on a ReportLab canvas. Rows are drawn top down and a new
+    # page is started whenever the next one would cross the bottom margin;
+    # header(layout) draws the page heading on every page and sets layout.y,
+    # and a table's column row repeats at the top of each page it continues
+    # onto. Rows can come from any iterator and nothing but the current page
+    # is laid out: finished pages are held only as compressed content
+    # streams until save(), a few KB each.
+    #
+    # Cells are (x, text) or (x, text, 'right') for amounts aligned on x.
+    def __init__(self, file_path, header, title=None, margin=50):
+        # ReportLab is only imported on the first render, so importing the
+        # PDF modules stays cheap for scripts that never draw anything
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        self.canvas = canvas.Canvas(file_path, pagesize=A4, pageCompression=1)
+        if title:
+            self.canvas.setTitle(title)
+        self.width, self.height = A4
+        self.margin = margin
+        self.header = header
+        self.page = 0
+        self.font = ("Helvetica", 12)
+        self._repeat = None
+        self._start_page()
+
+    def _start_page(self):
+        self.page += 1
+        self.y = self.height - self.margin
+        self.header(self)
+        self.canvas.setFont(*self.font)
+        if self._repeat:
+            self._draw(*self._repeat)
+
+    def _footer(self):
+        self.canvas.setFont("Helvetica", 9)
+        self.canvas.drawRightString(self.width - self.margin, self.margin / 2, f"Page {self.page}")
+
+    def new_page(self):
+        # Page numbers appear once a document runs past one page, so
+        # single-page output looks as it always did
+        self._footer()
+        self.canvas.showPage()
+        self._start_page()
+
+    def set_font(self, name, size):
+        self.font = (name, size)
+        self.canvas.setFont(name, size)
+
+    def ensure(self, height):
+        # Starts a new page unless `height` more points fit on this one;
+        # called before blocks that must not be split
+        if self.y - height < self.margin:
+            self.new_page()
+
+    def space(self, height):
+        self.y -= height
+
+    def _draw(self, cells, height, font):
+        if font:
+            self.canvas.setFont(*font)
+        for x, text, *align in cells:
+            if align and align[0] == 'right':
+                self.canvas.drawRightString(x, self.y, text)
+            else:
+                self.canvas.drawString(x, self.y, text)
+        if font:
+            self.canvas.setFont(*self.font)
+        self.y -= height
+
+    def row(self, cells, height=LINE, font=None):
+        self.ensure(height)
+        self._draw(cells, height, font)
+
+    def table(self, header, rows, height=LINE, font=None):
+        # The header row, kept with the first row, then every row of the
+        # iterable; the header is repeated on continuation pages
+        self.ensure(2 * height)
+        self._draw(header, height, font)
+        self._repeat = (header, height, font)
+        try:
+            for cells in rows:
+                self.row(cells, height)
+        finally:
+            self._repeat = None
+
+    def clip(self, text, width):
+        # Cuts text to fit `width` points in the current font
+        name, size = self.font
+        if self.canvas.stringWidth(text, name, size) <= width:
+            return text
+        while text and self.canvas.stringWidth(text + "...", name, size) > width:
+            text = text[:-1]
+        return text + "..."
+
+    def save(self):
+        if self.page > 1:
+            self._footer()
+        self.canvas.save()
@@ -0,0 +1,103 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+
+def to_cents(amount):
+    # Amounts arrive as floats or as text typed by the user; str() first so
+    # 1.005 rounds the way it reads rather than the way it is stored
+    if isinstance(amount, (int, float)) and abs(amount) < 1e13:
+        scaled = amount * 100
+        cents = round(scaled)
+        # Exact unless the amount sits on a half cent, where float error
+        # could round either way; those take the Decimal path
+        if abs(scaled - cents) < 0.49:
+            return int(cents)
+    if isinstance(amount, str):
+        amount = amount.strip() or 0
+    try:
+        value = Decimal(str(amount))
+    except ArithmeticError:
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount: {amount!r}")
+    return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return cents / 100
+
+
+def format_money(amount):
+    return f"${amount:.2f}"
+
+
+class ReceiptPricing:
+    # Integer-cents totals for one receipt. Line totals and the running
+    # subtotal are updated per item change; total and balance are derived
+    # on demand from the subtotal and the three adjustments:
+    #   total = max(subtotal * (1 - discount%) - fixed discount, 0)
+    #   balance_due = total - advance payment - later payments
+    def __init__(self):
+        self.lines = []
+        self.subtotal = 0
+        self.discount = 0  # percent, in hundredths of a percent
+        self.numerical_discount = 0
+        self.advance_payment = 0
+        self.payments = 0
+
+    @classmethod
+    def from_receipt(cls, receipt):
+        pricing = cls()
+        for item in receipt['items']:
+            pricing.add_line(item['quantity'], item['price'])
+        pricing.set_adjustments(receipt.get('discount', 0), receipt.get('numerical_discount', 0),
+                                receipt.get('advance_payment', 0))
+        pricing.payments = sum(to_cents(payment['amount']) for payment in receipt.get('payments', ()))
+        return pricing
+
+    def add_line(self, quantity, price):
+        total = quantity * to_cents(price)
+        self.lines.append(total)
+        self.subtotal += total
+        return total
+
+    def set_line(self, index, quantity, price):
+        total = quantity * to_cents(price)
+        self.subtotal += total - self.lines[index]
+        self.lines[index] = total
+        return total
+
+    def remove_line(self, index):
+        self.subtotal -= self.lines.pop(index)
+
+    def set_adjustments(self, discount, numerical_discount, advance_payment):
+        # Raises ValueError, leaving the previous values, if any is invalid
+        values = to_cents(discount), to_cents(numerical_discount), to_cents(advance_payment)
+        self.discount, self.numerical_discount, self.advance_payment = values
+
+    def total(self):
+        after_percent = (self.subtotal * (10000 - self.discount) + 5000) // 10000
+        return max(after_percent - self.numerical_discount, 0)
+
+    def balance_due(self):
+        return self.total() - self.advance_payment - self.payments
+
+    def summary(self):
+        # The stored receipt fields, in the float amounts receipts use
+        return {
+            'subtotal': from_cents(self.subtotal),
+            'discount': from_cents(self.discount),
+            'numerical_discount': from_cents(self.numerical_discount),
+            'advance_payment': from_cents(self.advance_payment),
+            'total': from_cents(self.total()),
+            'balance_due': from_cents(self.balance_due()),
+        }
+
+
+def price_receipt(receipt):
+    # Recomputes every derived amount of a receipt in place
+    pricing = ReceiptPricing.from_receipt(receipt)
+    for item, total in zip(receipt['items'], pricing.lines):
+        item['price'] = from_cents(to_cents(item['price']))
+        item['total'] = from_cents(total)
+    receipt.update(pricing.summary())
+    return receipt
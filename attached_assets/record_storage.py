@@ -0,0 +1,289 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+
+from pricing import from_cents, to_cents
+from serializers import dumps, loads
+from storage import in_date_range, read_migration_source
+
+# receipts.idx: a header, then one fixed-size slot per live receipt in id
+# order. Slot fields: id, date (YYYY-MM-DD HH:MM:SS), total, balance_due,
+# discount (hundredths of a percent), numerical_discount (amounts in
+# cents), and the offset, length and head length of its record in the
+# data file.
+MAGIC = b'OPTREC1\x00'
+HEAD = struct.Struct('<8sqqqqq16x')  # magic, count, next_id, generation, dead bytes, changes
+SLOT = struct.Struct('<q19sqqiqQIH3x')
+ID = struct.Struct('<q')
+DATE_SIZE = 19
+
+
+class _SlotIds:
+    # The id column of the slots as a sequence, for bisect
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return self.store._count
+
+    def __getitem__(self, position):
+        return ID.unpack_from(self.store._map, HEAD.size + position * SLOT.size)[0]
+
+
+class RecordReceiptStore:
+    # Receipts as variable-length records in an append-only data file
+    # (receipts.<generation>.dat), located through the fixed-size slots of a
+    # memory-mapped index (receipts.idx). The Nth newest receipt is slot
+    # count - 1 - N, so a page of headers is read by offset arithmetic;
+    # each record starts with a small head holding the client name and
+    # phone, the only header fields a slot has no room for. Opening the
+    # store maps the index and reads its header, whatever the history size.
+    #
+    # Updates append a new record and rewrite the slot in place; deletes
+    # shift the later slots down one. Superseded records are counted as dead
+    # bytes, and the data file is rewritten once they pass COMPACT_RATIO.
+    COMPACT_RATIO = 0.5
+    COMPACT_MIN_BYTES = 1 << 20
+    GROW_SLOTS = 1024
+
+    def __init__(self, path, journal_file=None, legacy_file=None, file_format='json'):
+        self.path = path
+        self.file_format = file_format
+        self.index_path = os.path.join(path, "receipts.idx")
+        self._lock = threading.RLock()
+        self._ids = _SlotIds(self)
+        self._map = None
+        self._data = None
+        if not os.path.exists(self.index_path):
+            self._create(journal_file, legacy_file)
+        self._open()
+
+    def _data_path(self, generation):
+        return os.path.join(self.path, f"receipts.{generation}.dat")
+
+    def _create(self, journal_file, legacy_file):
+        # First start: carry over the journal (or the older single file), ids
+        # included
+        receipts, next_id = read_migration_source(journal_file, legacy_file)
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(self._data_path(0), 'wb') as data, open(tmp_path, 'wb') as index:
+            index.write(HEAD.pack(MAGIC, len(receipts), next_id, 0, 0, 0))
+            for receipt in sorted(receipts, key=lambda r: r['id']):
+                record, head_length = self._encode(receipt)
+                index.write(self._pack_slot(receipt, data.tell(), len(record), head_length))
+                data.write(record)
+        os.replace(tmp_path, self.index_path)
+
+    def _open(self):
+        with open(self.index_path, 'r+b') as f:
+            self._map = mmap.mmap(f.fileno(), 0)
+            self._inode = os.fstat(f.fileno()).st_ino
+        magic, count, _, generation, _, _ = HEAD.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.index_path} is not a receipt index")
+        self._count = count
+        # A crash in the middle of a delete leaves the last slot twice
+        if count > 1 and self._ids[count - 1] <= self._ids[count - 2]:
+            self._set_head(count=count - 1)
+        self._data = open(self._data_path(generation), 'a+b')
+
+    def _close(self):
+        self._map.close()
+        self._data.close()
+
+    def _head(self):
+        return HEAD.unpack_from(self._map, 0)
+
+    def _set_head(self, count=None, next_id=None, dead=None):
+        # Every write bumps the change counter the signature is built from
+        magic, old_count, old_next_id, generation, old_dead, changes = self._head()
+        self._count = old_count if count is None else count
+        HEAD.pack_into(self._map, 0, magic, self._count, old_next_id if next_id is None else next_id,
+                       generation, old_dead if dead is None else dead, changes + 1)
+
+    def signature(self):
+        # Carried over by compaction and by copies of the data directory,
+        # unlike the index file's inode
+        with self._lock:
+            self._refresh()
+            _, _, _, generation, _, changes = self._head()
+            return generation, changes
+
+    def _refresh(self):
+        # Another process compacted (a new index file) or appended past
+        # the part of the index this process has mapped
+        if os.stat(self.index_path).st_ino != self._inode:
+            self._close()
+            self._open()
+            return
+        self._count = self._head()[1]
+        if HEAD.size + self._count * SLOT.size > len(self._map):
+            self._close()
+            self._open()
+
+    def _encode(self, receipt):
+        head = dumps([receipt['client_name'], receipt['client_phone']], self.file_format)
+        return head + dumps(receipt, self.file_format), len(head)
+
+    def _pack_slot(self, receipt, offset, length, head_length):
+        date = receipt['date'].encode('utf-8')
+        if len(date) > DATE_SIZE:
+            raise ValueError(f"Receipt date is not YYYY-MM-DD HH:MM:SS: {receipt['date']!r}")
+        return SLOT.pack(receipt['id'], date, to_cents(receipt['total']), to_cents(receipt['balance_due']),
+                         to_cents(receipt.get('discount', 0)), to_cents(receipt.get('numerical_discount', 0)),
+                         offset, length, head_length)
+
+    def _slot(self, position):
+        return SLOT.unpack_from(self._map, HEAD.size + position * SLOT.size)
+
+    def _position(self, receipt_id):
+        position = bisect.bisect_left(self._ids, receipt_id)
+        if position == self._count or self._ids[position] != receipt_id:
+            raise KeyError(receipt_id)
+        return position
+
+    def _read(self, slot, head_only=False):
+        _, _, _, _, _, _, offset, length, head_length = slot
+        self._data.seek(offset)
+        return self._data.read(head_length if head_only else length)
+
+    def _receipt(self, slot):
+        receipt = loads(self._read(slot)[slot[8]:])
+        receipt['id'] = slot[0]
+        return receipt
+
+    def _header(self, slot):
+        receipt_id, date, total, balance_due, discount, numerical_discount, _, _, _ = slot
+        client_name, client_phone = loads(self._read(slot, head_only=True))
+        return {
+            'id': receipt_id, 'date': date.rstrip(b'\x00').decode('utf-8'),
+            'client_name': client_name, 'client_phone': client_phone,
+            'total': from_cents(total), 'balance_due': from_cents(balance_due),
+            'discount': from_cents(discount), 'numerical_discount': from_cents(numerical_discount),
+        }
+
+    def _newest(self, start, limit):
+        # Positions of a newest-first page
+        end = self._count - start
+        return range(end - 1, max(end - limit, 0) - 1, -1)
+
+    def get_all(self):
+        with self._lock:
+            self._refresh()
+            return [self._receipt(self._slot(position)) for position in range(self._count)]
+
+    def get(self, receipt_id):
+        with self._lock:
+            self._refresh()
+            return self._receipt(self._slot(self._position(receipt_id)))
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return self._count
+
+    def page(self, start, limit):
+        with self._lock:
+            self._refresh()
+            return [self._receipt(self._slot(position)) for position in self._newest(start, limit)]
+
+    def header_page(self, start, limit):
+        with self._lock:
+            self._refresh()
+            return [self._header(self._slot(position)) for position in self._newest(start, limit)]
+
+    def header(self, receipt_id):
+        with self._lock:
+            self._refresh()
+            return self._header(self._slot(self._position(receipt_id)))
+
+    def headers(self, receipt_ids):
+        with self._lock:
+            self._refresh()
+            found = []
+            for receipt_id in receipt_ids:
+                try:
+                    found.append(self._header(self._slot(self._position(receipt_id))))
+                except KeyError:
+                    continue
+            return found
+
+    def receipts_between(self, since=None, until=None):
+        # Dates are in the slots, so only matching records are read
+        with self._lock:
+            self._refresh()
+            found = []
+            for position in range(self._count):
+                slot = self._slot(position)
+                if in_date_range({'date': slot[1].decode('utf-8')}, since, until):
+                    found.append(self._receipt(slot))
+            return found
+
+    def _write_record(self, receipt):
+        record, head_length = self._encode(receipt)
+        self._data.seek(0, os.SEEK_END)
+        offset = self._data.tell()
+        self._data.write(record)
+        self._data.flush()
+        return self._pack_slot(receipt, offset, len(record), head_length)
+
+    def append(self, receipt):
+        with self._lock:
+            self._refresh()
+            receipt['id'] = self._head()[2]
+            slot = self._write_record(receipt)
+            end = HEAD.size + (self._count + 1) * SLOT.size
+            if end > len(self._map):
+                self._map.resize(end + self.GROW_SLOTS * SLOT.size)
+            self._map[end - SLOT.size:end] = slot
+            self._set_head(count=self._count + 1, next_id=receipt['id'] + 1)
+            return receipt['id']
+
+    def update(self, receipt_id, receipt):
+        with self._lock:
+            self._refresh()
+            position = self._position(receipt_id)
+            dead = self._slot(position)[7]
+            receipt['id'] = receipt_id
+            start = HEAD.size + position * SLOT.size
+            self._map[start:start + SLOT.size] = self._write_record(receipt)
+            self._set_head(dead=self._head()[4] + dead)
+            self._maybe_compact()
+
+    def delete(self, receipt_id):
+        with self._lock:
+            self._refresh()
+            position = self._position(receipt_id)
+            dead = self._slot(position)[7]
+            start = HEAD.size + position * SLOT.size
+            end = HEAD.size + self._count * SLOT.size
+            self._map.move(start, start + SLOT.size, end - start - SLOT.size)
+            self._set_head(count=self._count - 1, dead=self._head()[4] + dead)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        size = self._data.seek(0, os.SEEK_END)
+        if size >= self.COMPACT_MIN_BYTES and self._head()[4] >= size * self.COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        # Copies the live records into the next generation's data file and
+        # writes a new index for it; replacing the index is the commit point,
+        # after which the old data file is removed
+        with self._lock:
+            self._refresh()
+            _, count, next_id, generation, _, changes = self._head()
+            tmp_path = self.index_path + '.tmp'
+            with open(self._data_path(generation + 1), 'wb') as data, open(tmp_path, 'wb') as index:
+                index.write(HEAD.pack(MAGIC, count, next_id, generation + 1, 0, changes + 1))
+                for position in range(count):
+                    slot = self._slot(position)
+                    index.write(SLOT.pack(*slot[:6], data.tell(), *slot[7:]))
+                    data.write(self._read(slot))
+            self._close()
+            os.replace(tmp_path, self.index_path)
+            os.remove(self._data_path(generation))
+            self._open()
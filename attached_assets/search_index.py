@@ -0,0 +1,198 @@
+import base64
+import bisect
+import heapq
+import unicodedata
+from array import array
+
+
+def normalize_name(text):
+    # Case- and accent-insensitive, with runs of whitespace collapsed
+    text = text or ""
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+
+def normalize_phone(text):
+    return ''.join(c for c in text or "" if c.isdigit())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _pack_ids(ids):
+    return base64.b64encode(array('q', ids).tobytes()).decode('ascii')
+
+
+def _unpack_ids(text):
+    ids = array('q')
+    ids.frombytes(base64.b64decode(text))
+    return ids
+
+
+class ClientSearchIndex:
+    # In-memory index over client names and phones. Queries shorter than a
+    # trigram are prefix lookups in a sorted list of (term, receipt_id)
+    # pairs; longer ones intersect trigram postings. Candidates are then
+    # verified newest first until the result limit is reached. A query
+    # matching a large share of receipts ("06", "a") skips the candidate set
+    # and checks receipts newest first instead, stopping at the limit.
+    def __init__(self):
+        self.docs = {}
+        self.keys = []
+        self.postings = {}
+        # Receipt ids in ascending order, for the newest-first scan
+        self.order = []
+
+    @classmethod
+    def build(cls, headers):
+        # Bulk load: collect the prefix keys and sort them once at the end
+        index = cls()
+        for header in headers:
+            index.keys.extend(index._index_doc(header['id'], header['client_name'], header['client_phone']))
+        index.keys.sort()
+        index.order = sorted(index.docs)
+        return index
+
+    @classmethod
+    def rebuild(cls, data_manager):
+        return cls.build(data_manager.iter_receipt_headers())
+
+    def receipt_saved(self, receipt):
+        self.add(receipt['id'], receipt['client_name'], receipt['client_phone'])
+
+    def receipt_updated(self, old_receipt, receipt):
+        self.remove(receipt['id'])
+        self.receipt_saved(receipt)
+
+    def receipt_deleted(self, old_receipt):
+        self.remove(old_receipt['id'])
+
+    def _terms(self, name, phone):
+        terms = set(name.split())
+        terms.add(name)
+        if phone:
+            terms.add(phone)
+        terms.discard("")
+        return terms
+
+    def _index_doc(self, receipt_id, client_name, client_phone):
+        # Records the document and its trigram postings, and returns the
+        # prefix keys still to be placed in self.keys
+        name = normalize_name(client_name)
+        phone = normalize_phone(client_phone)
+        self.docs[receipt_id] = (name, phone)
+        for gram in trigrams(name) | trigrams(phone):
+            self._posting(gram).add(receipt_id)
+        return [(term, receipt_id) for term in self._terms(name, phone)]
+
+    def add(self, receipt_id, client_name, client_phone):
+        self.remove(receipt_id)
+        for key in self._index_doc(receipt_id, client_name, client_phone):
+            bisect.insort(self.keys, key)
+        bisect.insort(self.order, receipt_id)
+
+    def remove(self, receipt_id):
+        if receipt_id not in self.docs:
+            return
+        name, phone = self.docs.pop(receipt_id)
+        del self.order[bisect.bisect_left(self.order, receipt_id)]
+        for term in self._terms(name, phone):
+            position = bisect.bisect_left(self.keys, (term, receipt_id))
+            if position < len(self.keys) and self.keys[position] == (term, receipt_id):
+                del self.keys[position]
+        for gram in trigrams(name) | trigrams(phone):
+            ids = self._posting(gram)
+            ids.discard(receipt_id)
+            if not ids:
+                del self.postings[gram]
+
+    def _posting(self, gram):
+        # Postings loaded from disk stay packed arrays until first touched
+        ids = self.postings.get(gram)
+        if ids is None:
+            ids = self.postings[gram] = set()
+        elif not isinstance(ids, set):
+            ids = self.postings[gram] = set(ids)
+        return ids
+
+    def _prefix_range(self, prefix):
+        low = bisect.bisect_left(self.keys, (prefix,))
+        return low, bisect.bisect_left(self.keys, (prefix + '\uffff',), low)
+
+    def _postings(self, text):
+        # Postings of text's trigrams, smallest first; empty when one of
+        # them has no posting, as then nothing can match
+        grams = trigrams(text)
+        if not grams <= self.postings.keys():
+            return []
+        return sorted((self._posting(gram) for gram in grams), key=len)
+
+    def _matches(self, texts, name, phone):
+        # Short texts match the start of a name word or of the phone, as the
+        # prefix keys do; longer ones match anywhere
+        for text in texts:
+            if len(text) < 3:
+                if (' ' + text) in (' ' + name) or phone.startswith(text):
+                    return True
+            elif text in name or text in phone:
+                return True
+        return False
+
+    def _verified(self, texts, receipt_ids, limit):
+        results = []
+        for receipt_id in receipt_ids:
+            name, phone = self.docs[receipt_id]
+            if self._matches(texts, name, phone):
+                results.append(receipt_id)
+                if len(results) == limit:
+                    break
+        return results
+
+    def search(self, query, limit=200):
+        # Receipt ids whose client name or phone matches, newest first
+        texts = {text for text in (normalize_name(query), normalize_phone(query)) if text}
+        # Past about sqrt(limit * receipts) candidates, scanning newest first
+        # reaches the limit sooner than collecting and ordering them would
+        dense = (limit * len(self.docs)) ** 0.5
+        candidates = set()
+        for text in texts:
+            if len(text) < 3:
+                low, high = self._prefix_range(text)
+                if high - low > dense:
+                    return self._verified(texts, reversed(self.order), limit)
+                candidates.update(receipt_id for _, receipt_id in self.keys[low:high])
+            else:
+                postings = self._postings(text)
+                if postings and len(postings[0]) > dense:
+                    return self._verified(texts, reversed(self.order), limit)
+                if postings:
+                    candidates.update(postings[0].intersection(*postings[1:]))
+        results = self._verified(texts, heapq.nlargest(limit, candidates), limit)
+        if len(results) < limit and len(candidates) > limit:
+            # Some of the newest candidates were trigram false positives
+            results = self._verified(texts, sorted(candidates, reverse=True), limit)
+        return results
+
+    def to_dict(self):
+        # Id lists are stored as packed 64-bit arrays so loading is mostly
+        # done in C rather than by rebuilding the index
+        return {
+            'ids': _pack_ids(self.docs),
+            'names': [name for name, _ in self.docs.values()],
+            'phones': [phone for _, phone in self.docs.values()],
+            'terms': [term for term, _ in self.keys],
+            'term_ids': _pack_ids(receipt_id for _, receipt_id in self.keys),
+            'postings': {gram: _pack_ids(ids) for gram, ids in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.docs = dict(zip(_unpack_ids(data['ids']), zip(data['names'], data['phones'])))
+        index.keys = list(zip(data['terms'], _unpack_ids(data['term_ids'])))
+        index.postings = {gram: _unpack_ids(ids) for gram, ids in data['postings'].items()}
+        index.order = sorted(index.docs)
+        return index
@@ -0,0 +1,121 @@
+import json
+import time
+
+# Binary files start with MAGIC, the format name and a newline. Files
+# without it are plain JSON, which is what every older version wrote, so
+# JSON files are left headerless and stay readable by those versions.
+MAGIC = b'\x00OPTIC:'
+
+
+class JsonFormat:
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class MsgpackFormat:
+    # MessagePack: smaller files and faster parsing than JSON. Optional;
+    # needs the msgpack package.
+    name = 'msgpack'
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def dumps(self, obj):
+        return self._msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        return self._msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+FORMATS = {
+    'json': JsonFormat,
+    'msgpack': MsgpackFormat,
+}
+
+
+def get_format(name):
+    if name not in FORMATS:
+        raise ValueError(f"Unknown data format: {name}")
+    try:
+        return FORMATS[name]()
+    except ImportError:
+        raise ValueError(f"The {name} data format needs the {name} package installed")
+
+
+def available_formats():
+    names = []
+    for name in FORMATS:
+        try:
+            get_format(name)
+        except ValueError:
+            continue
+        names.append(name)
+    return names
+
+
+def detect_format(data):
+    if data.startswith(MAGIC):
+        return data[len(MAGIC):data.index(b'\n')].decode('ascii')
+    return 'json'
+
+
+def dumps(obj, format_name='json'):
+    data = get_format(format_name).dumps(obj)
+    if format_name == 'json':
+        return data
+    return MAGIC + format_name.encode('ascii') + b'\n' + data
+
+
+def loads(data):
+    # Whatever format the data was written in
+    if data.startswith(MAGIC):
+        start = data.index(b'\n') + 1
+        return get_format(detect_format(data)).loads(data[start:])
+    return json.loads(data)
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+SAMPLE = {
+    'id': 12,
+    'date': '2024-05-01 10:00:00',
+    'client_name': 'Émile Zoë 李',
+    'client_phone': '',
+    'right_eye': {'sph': '-1.25', 'cyl': '', 'axe': '90'},
+    'left_eye': {'sph': '', 'cyl': '', 'axe': ''},
+    'items': [{'product': 'Verre "AR"', 'quantity': 2, 'price': 0.1, 'total': 0.2}],
+    'subtotal': 1e-7, 'discount': 12.5, 'numerical_discount': 0, 'advance_payment': -3.0,
+    'total': 123456789.99, 'balance_due': 0.0, 'payments': [], 'extra': None, 'flag': True,
+}
+
+
+def check_round_trip(obj, format_name):
+    # True when obj survives dumps/loads in the format exactly, as JSON
+    # would see it (tuples come back as lists in every format)
+    return loads(dumps(obj, format_name)) == json.loads(json.dumps(obj))
+
+
+def benchmark(obj, format_names=None, repeat=3):
+    # Best-of-repeat write and parse time and encoded size per format
+    results = []
+    for name in format_names or available_formats():
+        write = parse = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = dumps(obj, name)
+            written = time.perf_counter()
+            loads(data)
+            parsed = time.perf_counter()
+            write = min(write, written - started)
+            parse = min(parse, parsed - written)
+        results.append({'format': name, 'bytes': len(data), 'write': write, 'parse': parse})
+    return results
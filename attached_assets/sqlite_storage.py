@@ -0,0 +1,351 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from storage import RECEIPT_HEADER_FIELDS, load_config, open_storage, save_config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    price REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    client_name TEXT NOT NULL,
+    client_phone TEXT NOT NULL,
+    subtotal REAL NOT NULL,
+    discount REAL NOT NULL,
+    numerical_discount REAL NOT NULL,
+    advance_payment REAL NOT NULL,
+    total REAL NOT NULL,
+    balance_due REAL NOT NULL,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS receipt_items (
+    receipt_id INTEGER NOT NULL REFERENCES receipts(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    product TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    price REAL NOT NULL,
+    total REAL NOT NULL,
+    PRIMARY KEY (receipt_id, position)
+);
+CREATE TABLE IF NOT EXISTS prescriptions (
+    receipt_id INTEGER NOT NULL REFERENCES receipts(id) ON DELETE CASCADE,
+    eye TEXT NOT NULL,
+    sph TEXT NOT NULL,
+    cyl TEXT NOT NULL,
+    axe TEXT NOT NULL,
+    PRIMARY KEY (receipt_id, eye)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('changes', 0);
+-- One counter per store, so product edits leave receipt caches valid and
+-- the other way round; databases that predate them start from 'changes'
+INSERT OR IGNORE INTO meta (key, value) SELECT 'products_changes', value FROM meta WHERE key = 'changes';
+INSERT OR IGNORE INTO meta (key, value) SELECT 'receipts_changes', value FROM meta WHERE key = 'changes';
+CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
+CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts(date);
+CREATE INDEX IF NOT EXISTS idx_receipts_client_name ON receipts(client_name);
+CREATE INDEX IF NOT EXISTS idx_receipts_client_phone ON receipts(client_phone);
+"""
+
+RECEIPT_COLUMNS = ('date', 'client_name', 'client_phone', 'subtotal', 'discount',
+                   'numerical_discount', 'advance_payment', 'total', 'balance_due')
+EYES = ('right_eye', 'left_eye')
+HEADER_COLUMNS = ('id',) + RECEIPT_HEADER_FIELDS + ('numerical_discount',)
+
+
+class SQLiteDatabase:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self.products = SQLiteProductStore(self)
+        self.receipts = SQLiteReceiptStore(self)
+
+    def signature(self, counter):
+        # A change counter bumped inside every write transaction, so it is
+        # comparable across connections and restarts
+        with self.lock:
+            return self.conn.execute("SELECT value FROM meta WHERE key = ?", (counter,)).fetchone()[0]
+
+    def bump(self, counter):
+        self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = ?", (counter,))
+
+    def close(self):
+        self.conn.close()
+
+
+class SQLiteProductStore:
+    def __init__(self, db):
+        self.db = db
+
+    def signature(self):
+        return self.db.signature('products_changes')
+
+    def get_all(self):
+        with self.db.lock:
+            rows = self.db.conn.execute("SELECT name, price FROM products ORDER BY position").fetchall()
+        return [{'name': name, 'price': price} for name, price in rows]
+
+    def save_all(self, products):
+        with self.db.lock, self.db.conn:
+            self.db.conn.execute("DELETE FROM products")
+            self.db.bump('products_changes')
+            self.db.conn.executemany(
+                "INSERT INTO products (position, name, price) VALUES (?, ?, ?)",
+                [(position, p['name'], p['price']) for position, p in enumerate(products)]
+            )
+
+    def apply(self, ops):
+        # Same deltas as storage.apply_product_ops, as row updates; moves
+        # and deletes only shift the positions between the two ends
+        conn = self.db.conn
+        with self.db.lock, conn:
+            self.db.bump('products_changes')
+            for op in ops:
+                if op['op'] == 'add':
+                    conn.execute(
+                        "INSERT INTO products (position, name, price)"
+                        " SELECT COALESCE(MAX(position) + 1, 0), ?, ? FROM products",
+                        (op['product']['name'], op['product']['price'])
+                    )
+                    continue
+                row = conn.execute(
+                    "SELECT id, position FROM products WHERE name = ? ORDER BY position LIMIT 1", (op['name'],)
+                ).fetchone()
+                if row is None:
+                    raise KeyError(op['name'])
+                product_id, position = row
+                if op['op'] == 'set':
+                    conn.execute("UPDATE products SET name = ?, price = ? WHERE id = ?",
+                                 (op['product']['name'], op['product']['price'], product_id))
+                elif op['op'] == 'del':
+                    conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+                    conn.execute("UPDATE products SET position = position - 1 WHERE position > ?", (position,))
+                elif op['op'] == 'move':
+                    if op['to'] < position:
+                        conn.execute("UPDATE products SET position = position + 1"
+                                     " WHERE position >= ? AND position < ?", (op['to'], position))
+                    else:
+                        conn.execute("UPDATE products SET position = position - 1"
+                                     " WHERE position > ? AND position <= ?", (position, op['to']))
+                    conn.execute("UPDATE products SET position = ? WHERE id = ?", (op['to'], product_id))
+                else:
+                    raise ValueError(f"Unknown product op: {op['op']}")
+
+
+class SQLiteReceiptStore:
+    def __init__(self, db):
+        self.db = db
+
+    def signature(self):
+        return self.db.signature('receipts_changes')
+
+    def _write_children(self, receipt_id, receipt):
+        conn = self.db.conn
+        conn.executemany(
+            "INSERT INTO receipt_items (receipt_id, position, product, quantity, price, total)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(receipt_id, position, item['product'], item['quantity'], item['price'], item['total'])
+             for position, item in enumerate(receipt['items'])]
+        )
+        conn.executemany(
+            "INSERT INTO prescriptions (receipt_id, eye, sph, cyl, axe) VALUES (?, ?, ?, ?, ?)",
+            [(receipt_id, eye, receipt[eye]['sph'], receipt[eye]['cyl'], receipt[eye]['axe'])
+             for eye in EYES]
+        )
+
+    def _row_values(self, receipt):
+        # Anything outside the fixed columns survives in the extra JSON blob
+        extra = {k: v for k, v in receipt.items()
+                 if k not in RECEIPT_COLUMNS and k not in EYES and k not in ('id', 'items')}
+        values = [receipt.get('numerical_discount', 0) if column == 'numerical_discount' else receipt[column]
+                  for column in RECEIPT_COLUMNS]
+        return values + [json.dumps(extra) if extra else None]
+
+    def _build(self, rows, items, eyes):
+        receipts = []
+        for row in rows:
+            receipt_id = row[0]
+            receipt = {'id': receipt_id}
+            receipt.update(zip(RECEIPT_COLUMNS, row[1:-1]))
+            if row[-1]:
+                receipt.update(json.loads(row[-1]))
+            for eye in EYES:
+                receipt[eye] = eyes.get((receipt_id, eye), {'sph': '', 'cyl': '', 'axe': ''})
+            receipt['items'] = items.get(receipt_id, [])
+            receipts.append(receipt)
+        return receipts
+
+    def _select(self, where="", params=(), order="id", limit=-1, offset=0):
+        # Receipts and their child rows are filtered by the same id subquery
+        ids = f"SELECT id FROM receipts {where} ORDER BY {order} LIMIT ? OFFSET ?"
+        params = tuple(params) + (limit, offset)
+        conn = self.db.conn
+        with self.db.lock:
+            rows = conn.execute(
+                f"SELECT id, {', '.join(RECEIPT_COLUMNS)}, extra FROM receipts"
+                f" WHERE id IN ({ids}) ORDER BY {order}", params
+            ).fetchall()
+            items = {}
+            for receipt_id, product, quantity, price, total in conn.execute(
+                "SELECT receipt_id, product, quantity, price, total FROM receipt_items"
+                f" WHERE receipt_id IN ({ids}) ORDER BY receipt_id, position", params
+            ):
+                items.setdefault(receipt_id, []).append(
+                    {'product': product, 'quantity': quantity, 'price': price, 'total': total}
+                )
+            eyes = {}
+            for receipt_id, eye, sph, cyl, axe in conn.execute(
+                f"SELECT receipt_id, eye, sph, cyl, axe FROM prescriptions WHERE receipt_id IN ({ids})", params
+            ):
+                eyes[(receipt_id, eye)] = {'sph': sph, 'cyl': cyl, 'axe': axe}
+        return self._build(rows, items, eyes)
+
+    def get_all(self):
+        return self._select()
+
+    def get(self, receipt_id):
+        receipts = self._select("WHERE id = ?", (receipt_id,))
+        if not receipts:
+            raise KeyError(receipt_id)
+        return receipts[0]
+
+    def count(self):
+        with self.db.lock:
+            return self.db.conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+
+    def page(self, start, limit):
+        return self._select(order="id DESC", limit=limit, offset=start)
+
+    def header_page(self, start, limit):
+        # Served from the receipts table alone; child tables are not touched
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                f"SELECT {', '.join(HEADER_COLUMNS)} FROM receipts ORDER BY id DESC LIMIT ? OFFSET ?",
+                (limit, start)
+            ).fetchall()
+        return [dict(zip(HEADER_COLUMNS, row)) for row in rows]
+
+    def header(self, receipt_id):
+        headers = self.headers([receipt_id])
+        if not headers:
+            raise KeyError(receipt_id)
+        return headers[0]
+
+    def headers(self, receipt_ids):
+        found = {}
+        receipt_ids = list(receipt_ids)
+        with self.db.lock:
+            for i in range(0, len(receipt_ids), 500):
+                chunk = receipt_ids[i:i + 500]
+                for row in self.db.conn.execute(
+                    f"SELECT {', '.join(HEADER_COLUMNS)} FROM receipts"
+                    f" WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                ):
+                    found[row[0]] = dict(zip(HEADER_COLUMNS, row))
+        return [found[i] for i in receipt_ids if i in found]
+
+    def receipts_between(self, since=None, until=None):
+        # Served by the date index; dates sort as text
+        clauses, params = [], []
+        if since:
+            clauses.append("date >= ?")
+            params.append(since)
+        if until:
+            clauses.append("date < ?")
+            params.append(until + "~")
+        return self._select("WHERE " + " AND ".join(clauses) if clauses else "", params)
+
+    def _insert(self, receipt, keep_id=False):
+        columns = RECEIPT_COLUMNS + ('extra',)
+        values = self._row_values(receipt)
+        if keep_id and 'id' in receipt:
+            # Migrated receipts keep the ids they already had
+            columns = ('id',) + columns
+            values = [receipt['id']] + values
+        cursor = self.db.conn.execute(
+            f"INSERT INTO receipts ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            values
+        )
+        receipt['id'] = cursor.lastrowid
+        self._write_children(receipt['id'], receipt)
+        return receipt['id']
+
+    def append(self, receipt):
+        with self.db.lock, self.db.conn:
+            self.db.bump('receipts_changes')
+            return self._insert(receipt)
+
+    def extend(self, receipts):
+        with self.db.lock, self.db.conn:
+            self.db.bump('receipts_changes')
+            for receipt in receipts:
+                self._insert(receipt, keep_id=True)
+
+    def update(self, receipt_id, receipt):
+        with self.db.lock, self.db.conn:
+            assignments = ', '.join(f"{column} = ?" for column in RECEIPT_COLUMNS + ('extra',))
+            cursor = self.db.conn.execute(
+                f"UPDATE receipts SET {assignments} WHERE id = ?",
+                self._row_values(receipt) + [receipt_id]
+            )
+            if not cursor.rowcount:
+                raise KeyError(receipt_id)
+            self.db.bump('receipts_changes')
+            receipt['id'] = receipt_id
+            self.db.conn.execute("DELETE FROM receipt_items WHERE receipt_id = ?", (receipt_id,))
+            self.db.conn.execute("DELETE FROM prescriptions WHERE receipt_id = ?", (receipt_id,))
+            self._write_children(receipt_id, receipt)
+
+    def delete(self, receipt_id):
+        with self.db.lock, self.db.conn:
+            cursor = self.db.conn.execute("DELETE FROM receipts WHERE id = ?", (receipt_id,))
+            if not cursor.rowcount:
+                raise KeyError(receipt_id)
+            self.db.bump('receipts_changes')
+
+
+def migrate_json_to_sqlite(data_dir):
+    # One-shot import of the products and receipts into a fresh optical.db,
+    # read through whichever file backend config.json names, then switch
+    # the config over.
+    db_path = os.path.join(data_dir, "optical.db")
+    config = load_config(data_dir, environ=False)
+    if config['storage'] == 'sqlite':
+        raise RuntimeError(f"{data_dir} already uses SQLite storage")
+    product_store, receipt_store = open_storage(data_dir, config['storage'], config['format'])
+    products = product_store.get_all()
+    receipts = receipt_store.get_all()
+
+    database = SQLiteDatabase(db_path)
+    try:
+        if database.conn.execute("SELECT EXISTS (SELECT 1 FROM receipts)").fetchone()[0]:
+            raise RuntimeError(f"{db_path} already contains receipts")
+        database.products.save_all(products)
+        database.receipts.extend(receipts)
+    finally:
+        database.close()
+
+    config['storage'] = 'sqlite'
+    save_config(data_dir, config)
+    return len(products), len(receipts)
+
+if __name__ == "__main__":
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    product_count, receipt_count = migrate_json_to_sqlite(data_dir)
+    print(f"Migrated {product_count} products and {receipt_count} receipts into {data_dir}/optical.db")
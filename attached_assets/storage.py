@@ -0,0 +1,728 @@
+import copy
+import itertools
+import json
+import os
+import threading
+import zlib
+
+from serializers import FORMATS, dumps, loads, read_file
+
+STORAGE_BACKENDS = ('json', 'journal', 'sqlite', 'partitioned', 'records')
+DEFAULT_CONFIG = {
+    'storage': 'journal',
+    # Format for whole-file data (products, receipts.json, derived
+    # indexes); see serializers.FORMATS
+    'format': 'json',
+    # When commits reach the disk; see write_behind.WriteBehind
+    'fsync': 'always',
+}
+# always: every commit; flush: on DataManager.flush(); never: left to the OS
+FSYNC_POLICIES = ('always', 'flush', 'never')
+
+
+def load_config(data_dir, environ=True):
+    config = dict(DEFAULT_CONFIG)
+    path = os.path.join(data_dir, "config.json")
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            config.update(json.load(f))
+    # Environment override for one-off runs against another backend
+    if environ and os.environ.get("OPTICAL_STORAGE"):
+        config['storage'] = os.environ["OPTICAL_STORAGE"]
+    if config['storage'] not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {config['storage']}")
+    if config['format'] not in FORMATS:
+        raise ValueError(f"Unknown data format: {config['format']}")
+    if config['fsync'] not in FSYNC_POLICIES:
+        raise ValueError(f"Unknown fsync policy: {config['fsync']}")
+    return config
+
+
+def save_config(data_dir, config):
+    with open(os.path.join(data_dir, "config.json"), 'w') as f:
+        json.dump(config, f, indent=2)
+
+
+def open_storage(data_dir, backend, file_format='json', writer=None):
+    products_file = os.path.join(data_dir, "products.json")
+    receipts_file = os.path.join(data_dir, "receipts.json")
+    if backend == 'sqlite':
+        from sqlite_storage import SQLiteDatabase
+        database = SQLiteDatabase(os.path.join(data_dir, "optical.db"))
+        return database.products, database.receipts
+    # Only the whole-file stores go through the writer; the others append
+    # each change where it belongs
+    products = JsonProductStore(products_file, file_format, writer)
+    if backend == 'json':
+        return products, JsonReceiptStore(receipts_file, file_format, writer)
+    journal_file = os.path.join(data_dir, "receipts.jsonl")
+    if backend == 'partitioned':
+        from partitioned_storage import PartitionedReceiptStore
+        return products, PartitionedReceiptStore(os.path.join(data_dir, "receipts"), journal_file=journal_file,
+                                                 legacy_file=receipts_file, file_format=file_format)
+    if backend == 'records':
+        from record_storage import RecordReceiptStore
+        return products, RecordReceiptStore(os.path.join(data_dir, "records"), journal_file=journal_file,
+                                            legacy_file=receipts_file, file_format=file_format)
+    return products, JournalReceiptStore(journal_file, legacy_file=receipts_file)
+
+
+RECEIPT_HEADER_FIELDS = ('date', 'client_name', 'client_phone', 'total', 'balance_due', 'discount')
+
+
+def receipt_header(receipt):
+    # The compact projection the history grid needs; the full body (items and
+    # prescriptions) is only loaded for details and PDFs
+    header = {'id': receipt['id']}
+    for field in RECEIPT_HEADER_FIELDS:
+        header[field] = receipt[field]
+    header['numerical_discount'] = receipt.get('numerical_discount', 0)
+    return header
+
+
+def in_date_range(receipt, since=None, until=None):
+    # since/until are inclusive YYYY-MM-DD bounds; None leaves a side open
+    day = receipt['date'][:10]
+    return (not since or day >= since) and (not until or day <= until)
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def apply_product_ops(products, ops):
+    # Product edits as deltas: {'op': 'add', 'product'}, {'op': 'set',
+    # 'name', 'product'}, {'op': 'del', 'name'} and {'op': 'move', 'name',
+    # 'to'}. Applied in place; raises KeyError for an unknown name.
+    for op in ops:
+        if op['op'] == 'add':
+            products.append(op['product'])
+            continue
+        position = next((i for i, p in enumerate(products) if p['name'] == op['name']), None)
+        if position is None:
+            raise KeyError(op['name'])
+        if op['op'] == 'set':
+            products[position] = op['product']
+        elif op['op'] == 'del':
+            del products[position]
+        elif op['op'] == 'move':
+            products.insert(op['to'], products.pop(position))
+        else:
+            raise ValueError(f"Unknown product op: {op['op']}")
+    return products
+
+
+def write_atomic(path, data, fsync=False):
+    # Readers see the old file or the new one, never a partial write. With
+    # fsync the data and the rename are on disk when this returns.
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if fsync:
+        _fsync_directory(os.path.dirname(path))
+
+
+def _fsync_directory(path):
+    # Directories cannot be opened for syncing on Windows, where the rename
+    # is made durable by the file system itself
+    if os.name != 'posix':
+        return
+    fd = os.open(path or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BufferedFileStore:
+    # Base of the whole-file stores. Changes are made to the in-memory copy
+    # and committed through a WriteBehind writer, so a burst of edits ends up
+    # as one atomic write; without a writer each change is committed at once.
+    #
+    # While the in-memory copy is ahead of the files, or equal to what this
+    # process last wrote, signature() is (base, changes since base): our own
+    # timed commits do not look like an outside change to the caches keyed on
+    # it. flush() commits and re-bases it on the files' signature, which is
+    # what a fresh process computes.
+    def __init__(self, writer=None):
+        self.writer = writer
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+        self._base = None
+        self._written = None
+        self._version = 0
+
+    def _current(self):
+        # The in-memory copy is the latest state of the store
+        return self._loaded and (self._dirty or self._file_signature() == self._written)
+
+    def _loaded_from(self, signature):
+        self._loaded = True
+        self._dirty = False
+        self._base = self._written = signature
+        self._version = 0
+
+    def signature(self):
+        with self._lock:
+            if self._current():
+                return self._base, self._version
+            return self._file_signature(), 0
+
+    def _changed(self):
+        self._version += 1
+        self._dirty = True
+        if self.writer is None:
+            self.flush()
+        else:
+            self.writer.schedule(self.commit)
+
+    def commit(self, durable=False):
+        with self._lock:
+            if self._dirty:
+                self._write(durable)
+                self._written = self._file_signature()
+                self._dirty = False
+
+    def discard(self):
+        # Forgets the in-memory copy and any change not written yet; the
+        # next read loads the files
+        with self._lock:
+            self._loaded = False
+            self._dirty = False
+
+    def flush(self):
+        with self._lock:
+            self.commit(durable=self.writer is not None and self.writer.fsync != 'never')
+            if self._loaded and self._file_signature() == self._written:
+                self._base = self._written
+                self._version = 0
+
+
+class JsonProductStore(BufferedFileStore):
+    # products.json holds the full list as before. Later edits are appended
+    # to products.ops.jsonl, whose first line carries the CRC of the
+    # products.json it applies to; a log whose CRC does not match is stale
+    # (the list was rewritten after it) and is ignored. The list is
+    # rewritten and the log restarted every COMPACT_OPS edits.
+    COMPACT_OPS = 200
+
+    def __init__(self, path, file_format='json', writer=None):
+        super().__init__(writer)
+        self.path = path
+        self.file_format = file_format
+        self.ops_path = os.path.splitext(path)[0] + ".ops.jsonl"
+        self._products = []
+        # Ops in the log, or None when the log is missing, stale or torn
+        # and must be restarted; ops not written yet; a full rewrite due
+        self._logged = None
+        self._pending = []
+        self._rewrite = False
+        if not os.path.exists(self.path):
+            self.save_all([])
+            self.flush()
+
+    def _file_signature(self):
+        ops = file_signature(self.ops_path) if os.path.exists(self.ops_path) else None
+        return file_signature(self.path), ops
+
+    def _load(self):
+        signature = self._file_signature()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        products = loads(data)
+        logged = None
+        if os.path.exists(self.ops_path):
+            with open(self.ops_path, 'r') as f:
+                lines = f.read().split('\n')
+            try:
+                header = json.loads(lines[0])
+            except ValueError:
+                header = {}
+            if header.get('crc') == zlib.crc32(data):
+                ops = [json.loads(line) for line in lines[1:-1] if line]
+                apply_product_ops(products, ops)
+                # A last line without its newline is a torn append
+                if not lines[-1]:
+                    logged = len(ops)
+        self._products = products
+        self._logged = logged
+        self._loaded_from(signature)
+
+    def get_all(self):
+        with self._lock:
+            if not self._current():
+                self._load()
+            return [dict(product) for product in self._products]
+
+    def save_all(self, products):
+        with self._lock:
+            self._products = [dict(product) for product in products]
+            self._pending = []
+            self._rewrite = True
+            self._loaded = True
+            self._changed()
+
+    def apply(self, ops):
+        with self._lock:
+            if not self._current():
+                self._load()
+            ops = copy.deepcopy(ops)
+            apply_product_ops(self._products, ops)
+            self._pending.extend(ops)
+            self._changed()
+
+    def _write(self, durable):
+        if self._rewrite or self._logged is None or self._logged + len(self._pending) > self.COMPACT_OPS:
+            data = dumps(self._products, self.file_format)
+            write_atomic(self.path, data, durable)
+            write_atomic(self.ops_path, json.dumps({'crc': zlib.crc32(data)}).encode() + b'\n', durable)
+            self._logged = 0
+        else:
+            with open(self.ops_path, 'a') as f:
+                f.write(''.join(json.dumps(op) + '\n' for op in self._pending))
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._logged += len(self._pending)
+        self._pending = []
+        self._rewrite = False
+
+
+def read_receipt_file(path):
+    # receipts.json as (receipts, next id). Current files hold
+    # {"next_id": ..., "receipts": [...]}; older ones are a bare list, whose
+    # receipts written before ids existed are numbered after the highest
+    # known id, in file order.
+    data = read_file(path)
+    if isinstance(data, dict):
+        return data['receipts'], data['next_id']
+    next_id = max((r['id'] for r in data if 'id' in r), default=0) + 1
+    for receipt in data:
+        if 'id' not in receipt:
+            receipt['id'] = next_id
+            next_id += 1
+    return data, next_id
+
+
+class JsonReceiptStore(BufferedFileStore):
+    # Original layout: the whole history in one file, rewritten on every
+    # commit. Kept for installs that have not migrated. The next id is
+    # saved with the receipts, so ids are never reused, even after the
+    # newest receipt is deleted.
+    def __init__(self, path, file_format='json', writer=None):
+        super().__init__(writer)
+        self.path = path
+        self.file_format = file_format
+        self._receipts = []
+        self._positions = {}
+        self._next_id = 1
+        if not os.path.exists(self.path):
+            self.save_all([])
+            self.flush()
+
+    def _file_signature(self):
+        return file_signature(self.path)
+
+    def _write(self, durable):
+        data = {'next_id': self._next_id, 'receipts': self._receipts}
+        write_atomic(self.path, dumps(data, self.file_format), durable)
+
+    def save_all(self, receipts):
+        with self._lock:
+            self._receipts = copy.deepcopy(receipts)
+            self._positions = {r['id']: position for position, r in enumerate(self._receipts)}
+            self._next_id = max(self._next_id, max(self._positions, default=0) + 1)
+            self._loaded = True
+            self._changed()
+
+    def _load(self):
+        # The in-memory history, read from the file when it changed
+        if self._current():
+            return self._receipts, self._positions
+        signature = self._file_signature()
+        self._receipts, self._next_id = read_receipt_file(self.path)
+        self._positions = {r['id']: position for position, r in enumerate(self._receipts)}
+        self._loaded_from(signature)
+        return self._receipts, self._positions
+
+    # Callers own what they get back, as when every read parsed the file
+
+    def get_all(self):
+        with self._lock:
+            return copy.deepcopy(self._load()[0])
+
+    def get(self, receipt_id):
+        with self._lock:
+            receipts, positions = self._load()
+            return copy.deepcopy(receipts[positions[receipt_id]])
+
+    def count(self):
+        with self._lock:
+            return len(self._load()[0])
+
+    def page(self, start, limit):
+        with self._lock:
+            receipts = self._load()[0]
+            end = len(receipts) - start
+            return copy.deepcopy(receipts[max(end - limit, 0):max(end, 0)][::-1])
+
+    def header_page(self, start, limit):
+        with self._lock:
+            receipts = self._load()[0]
+            end = len(receipts) - start
+            return [receipt_header(receipt) for receipt in receipts[max(end - limit, 0):max(end, 0)][::-1]]
+
+    def header(self, receipt_id):
+        with self._lock:
+            receipts, positions = self._load()
+            return receipt_header(receipts[positions[receipt_id]])
+
+    def headers(self, receipt_ids):
+        with self._lock:
+            receipts, positions = self._load()
+            return [receipt_header(receipts[positions[i]]) for i in receipt_ids if i in positions]
+
+    def receipts_between(self, since=None, until=None):
+        with self._lock:
+            return copy.deepcopy([r for r in self._load()[0] if in_date_range(r, since, until)])
+
+    def append(self, receipt):
+        with self._lock:
+            receipts, positions = self._load()
+            receipt['id'] = self._next_id
+            self._next_id += 1
+            positions[receipt['id']] = len(receipts)
+            receipts.append(copy.deepcopy(receipt))
+            self._changed()
+            return receipt['id']
+
+    def update(self, receipt_id, receipt):
+        with self._lock:
+            receipts, positions = self._load()
+            position = positions[receipt_id]
+            receipt['id'] = receipt_id
+            receipts[position] = copy.deepcopy(receipt)
+            self._changed()
+
+    def delete(self, receipt_id):
+        with self._lock:
+            receipts, positions = self._load()
+            del receipts[positions.pop(receipt_id)]
+            self._positions = {r['id']: position for position, r in enumerate(receipts)}
+            self._changed()
+
+
+class JournalReceiptStore:
+    # Receipts live in an append-only JSON-Lines log. Every save, update or
+    # delete is a single appended record; the in-memory index maps each receipt
+    # id to the (offset, length) of its latest "put" line so reads can seek
+    # straight to it.
+    #
+    # A sidecar log of compact headers (offset, length and the fields the
+    # history grid shows) is appended alongside, so opening the store and
+    # listing history never parses item or prescription payloads.
+    COMPACT_RATIO = 0.5
+    COMPACT_MIN_RECORDS = 200
+
+    def __init__(self, path, legacy_file=None):
+        self.path = path
+        self.headers_path = os.path.splitext(path)[0] + ".headers.jsonl"
+        self._lock = threading.RLock()
+        self._index = {}
+        self._next_id = 1
+        self._generation = 0
+        self._records = 0
+        self._size = 0
+        self._compacting = False
+        if not os.path.exists(self.path):
+            self._create(legacy_file)
+        self._load()
+
+    def _create(self, legacy_file):
+        # Carry over receipts from the old single-file layout on first start
+        receipts = []
+        if legacy_file and os.path.exists(legacy_file):
+            receipts = read_receipt_file(legacy_file)[0]
+        with open(self.path, 'wb') as f:
+            for receipt_id, receipt in enumerate(receipts, start=1):
+                receipt['id'] = receipt_id
+                f.write(self._encode({'op': 'put', 'id': receipt_id, 'receipt': receipt}))
+
+    def signature(self):
+        return file_signature(self.path)
+
+    def _refresh(self):
+        # Another process (or an older copy of the app) changed the log:
+        # rebuild the index before trusting any offsets
+        if os.path.getsize(self.path) != self._size:
+            self._load()
+
+    def _log_generation(self):
+        with open(self.path, 'rb') as f:
+            first = f.readline()
+        if first.endswith(b'\n'):
+            entry = json.loads(first)
+            if entry['op'] == 'meta':
+                return entry.get('generation', 0)
+        return 0
+
+    def _load(self):
+        self._index = {}
+        self._next_id = 1
+        self._records = 0
+        self._size = 0
+        self._generation = self._log_generation()
+        if not self._load_headers():
+            self._index = {}
+            self._records = 0
+            self._size = 0
+            with open(self.headers_path, 'wb') as f:
+                f.write(self._encode({'generation': self._generation}))
+        # Anything the sidecar has not caught up with is read from the log
+        self._scan_log()
+
+    def _load_headers(self):
+        if not os.path.exists(self.headers_path):
+            return False
+        log_size = os.path.getsize(self.path)
+        offset = 0
+        with open(self.headers_path, 'rb') as f:
+            first = f.readline()
+            if not first.endswith(b'\n'):
+                return False
+            meta = json.loads(first)
+            if meta.get('generation') != self._generation:
+                return False
+            self._next_id = meta.get('next_id', 1)
+            offset = len(first)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                entry = json.loads(line)
+                if entry['off'] + entry['len'] > log_size:
+                    return False
+                if 'h' in entry:
+                    self._index[entry['id']] = (entry['off'], entry['len'], entry['h'])
+                else:
+                    self._index.pop(entry['id'], None)
+                self._next_id = max(self._next_id, entry['id'] + 1)
+                self._records += 1
+                self._size = entry['off'] + entry['len']
+                offset += len(line)
+        if offset != os.path.getsize(self.headers_path):
+            os.truncate(self.headers_path, offset)
+        return True
+
+    def _scan_log(self):
+        offset = self._size
+        header_lines = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Torn write from a crash: drop the partial record
+                    break
+                header_line = self._apply(self._index, json.loads(line), offset, len(line))
+                if header_line:
+                    header_lines.append(header_line)
+                self._records += 1
+                offset += len(line)
+        if offset != os.path.getsize(self.path):
+            os.truncate(self.path, offset)
+        if header_lines:
+            with open(self.headers_path, 'ab') as f:
+                f.write(b''.join(header_lines))
+        self._size = offset
+
+    def _apply(self, index, entry, offset, length):
+        # Applies one log entry to an index and returns the matching
+        # sidecar line (None for meta records)
+        op = entry['op']
+        if op == 'meta':
+            self._next_id = max(self._next_id, entry['next_id'])
+            return None
+        self._next_id = max(self._next_id, entry['id'] + 1)
+        if op == 'put':
+            entry['receipt']['id'] = entry['id']
+            header = receipt_header(entry['receipt'])
+            index[entry['id']] = (offset, length, header)
+            return self._encode({'id': entry['id'], 'off': offset, 'len': length, 'h': header})
+        index.pop(entry['id'], None)
+        return self._encode({'id': entry['id'], 'off': offset, 'len': length})
+
+    def _encode(self, entry):
+        return (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+
+    def _append(self, entry):
+        line = self._encode(entry)
+        with open(self.path, 'ab') as f:
+            f.write(line)
+        header_line = self._apply(self._index, entry, self._size, len(line))
+        with open(self.headers_path, 'ab') as f:
+            f.write(header_line)
+        self._size += len(line)
+        self._records += 1
+
+    def _read(self, f, receipt_id):
+        offset, length, _ = self._index[receipt_id]
+        f.seek(offset)
+        receipt = json.loads(f.read(length))['receipt']
+        receipt['id'] = receipt_id
+        return receipt
+
+    def get_all(self):
+        with self._lock:
+            self._refresh()
+            with open(self.path, 'rb') as f:
+                return [self._read(f, receipt_id) for receipt_id in self._index]
+
+    def get(self, receipt_id):
+        with self._lock:
+            self._refresh()
+            with open(self.path, 'rb') as f:
+                return self._read(f, receipt_id)
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def page(self, start, limit):
+        # Newest first; only the requested records are read and parsed
+        with self._lock:
+            self._refresh()
+            ids = list(itertools.islice(reversed(self._index), start, start + limit))
+            with open(self.path, 'rb') as f:
+                return [self._read(f, receipt_id) for receipt_id in ids]
+
+    def header_page(self, start, limit):
+        with self._lock:
+            self._refresh()
+            entries = itertools.islice(reversed(self._index.values()), start, start + limit)
+            return [header for _, _, header in entries]
+
+    def header(self, receipt_id):
+        with self._lock:
+            self._refresh()
+            return self._index[receipt_id][2]
+
+    def headers(self, receipt_ids):
+        with self._lock:
+            self._refresh()
+            return [self._index[i][2] for i in receipt_ids if i in self._index]
+
+    def receipts_between(self, since=None, until=None):
+        # Dates are in the headers, so only matching bodies are read
+        with self._lock:
+            self._refresh()
+            ids = [receipt_id for receipt_id, (_, _, header) in self._index.items()
+                   if in_date_range(header, since, until)]
+            with open(self.path, 'rb') as f:
+                return [self._read(f, receipt_id) for receipt_id in ids]
+
+    def append(self, receipt):
+        with self._lock:
+            self._refresh()
+            receipt['id'] = self._next_id
+            self._append({'op': 'put', 'id': receipt['id'], 'receipt': receipt})
+            return receipt['id']
+
+    def update(self, receipt_id, receipt):
+        with self._lock:
+            self._refresh()
+            if receipt_id not in self._index:
+                raise KeyError(receipt_id)
+            receipt['id'] = receipt_id
+            self._append({'op': 'put', 'id': receipt_id, 'receipt': receipt})
+            self._maybe_compact()
+
+    def delete(self, receipt_id):
+        with self._lock:
+            self._refresh()
+            if receipt_id not in self._index:
+                raise KeyError(receipt_id)
+            self._append({'op': 'del', 'id': receipt_id})
+            self._maybe_compact()
+
+    def dead_ratio(self):
+        if not self._records:
+            return 0.0
+        return 1 - len(self._index) / self._records
+
+    def _maybe_compact(self):
+        if self._compacting or self._records < self.COMPACT_MIN_RECORDS:
+            return
+        if self.dead_ratio() < self.COMPACT_RATIO:
+            return
+        self._compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        # Copy live records into a fresh log without holding the lock, then
+        # replay whatever was appended meanwhile and swap the files. The new
+        # log carries a bumped generation so a stale sidecar is never trusted.
+        with self._lock:
+            snapshot = list(self._index.items())
+            end = self._size
+            next_id = self._next_id
+            generation = self._generation + 1
+        tmp_path = self.path + '.tmp'
+        tmp_headers_path = self.headers_path + '.tmp'
+        new_index = {}
+        try:
+            with open(self.path, 'rb') as src, open(tmp_path, 'wb') as dst, \
+                    open(tmp_headers_path, 'wb') as headers:
+                dst.write(self._encode({'op': 'meta', 'next_id': next_id, 'generation': generation}))
+                headers.write(self._encode({'generation': generation, 'next_id': next_id}))
+                for receipt_id, (offset, length, header) in snapshot:
+                    src.seek(offset)
+                    new_index[receipt_id] = (dst.tell(), length, header)
+                    headers.write(self._encode({'id': receipt_id, 'off': dst.tell(), 'len': length, 'h': header}))
+                    dst.write(src.read(length))
+                offset = dst.tell()
+            records = len(snapshot) + 1
+            with self._lock:
+                with open(self.path, 'rb') as src:
+                    src.seek(end)
+                    tail = src.read(self._size - end)
+                header_lines = []
+                for line in tail.splitlines(keepends=True):
+                    header_lines.append(self._apply(new_index, json.loads(line), offset, len(line)))
+                    records += 1
+                    offset += len(line)
+                with open(tmp_path, 'ab') as dst:
+                    dst.write(tail)
+                with open(tmp_headers_path, 'ab') as headers:
+                    headers.write(b''.join(header_lines))
+                os.replace(tmp_path, self.path)
+                os.replace(tmp_headers_path, self.headers_path)
+                self._index = new_index
+                self._generation = generation
+                self._records = records
+                self._size = offset
+        finally:
+            self._compacting = False
+            for path in (tmp_path, tmp_headers_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def read_migration_source(journal_file=None, legacy_file=None):
+    # Receipts of the store a new backend is created from (the journal, or
+    # the older single file) and its next id. The id counter is carried over
+    # rather than recomputed, so the ids of receipts deleted before the
+    # migration are never handed out again.
+    if journal_file and os.path.exists(journal_file):
+        store = JournalReceiptStore(journal_file)
+    elif legacy_file and os.path.exists(legacy_file):
+        store = JsonReceiptStore(legacy_file)
+    else:
+        return [], 1
+    receipts = store.get_all()
+    return receipts, max(store._next_id, max((r['id'] for r in receipts), default=0) + 1)
@@ -0,0 +1,68 @@
+import atexit
+import threading
+import weakref
+
+from instrumentation import metrics, span
+from storage import FSYNC_POLICIES
+
+# Writers with commits still waiting when the interpreter exits (an error
+# or sys.exit before DataManager.flush()) run them from the atexit hook
+_writers = weakref.WeakSet()
+
+
+class WriteBehind:
+    # Group commit for the whole-file stores. A change schedules its store's
+    # commit; the first change of a burst starts a timer and everything
+    # changed before it fires is written in one go. The timer is not pushed
+    # back by later changes, so nothing waits longer than `delay` seconds.
+    #
+    # fsync policies ("fsync" in config.json): always syncs every commit;
+    # flush leaves timed commits to the OS and syncs on flush() (shutdown,
+    # format conversion); never syncs nothing, so a power cut can lose the
+    # last few seconds.
+    #
+    # Commits run on the timer thread. One that fails (disk full, file locked
+    # by an antivirus) leaves its store dirty and is retried by the next
+    # change or flush; the in-memory state stays the truth meanwhile.
+    def __init__(self, fsync='always', delay=0.5):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.fsync = fsync
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+        _writers.add(self)
+
+    def schedule(self, commit):
+        with self._lock:
+            self._pending[commit] = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self._run)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+            self._timer = None
+        with span("write_behind.commit"):
+            for commit in pending:
+                try:
+                    commit(self.fsync == 'always')
+                except OSError:
+                    metrics.increment("write_behind.failed")
+
+    def drain(self):
+        # Runs the waiting commits now, on the calling thread
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self._run()
+
+
+@atexit.register
+def _drain_all():
+    for writer in list(_writers):
+        writer.drain()